@@ -1,153 +1,126 @@
-import keyboard
-import numpy as np
-import random
+import argparse
 import os
 import time
-from threading import Thread, Lock
+from client import RemoteBoard
+from engine import Board
+from latency import LATENCY_FILE, LatencyMonitor
+from profiler import SamplingProfiler
+from replay import REPLAY_FILE, Recorder, write_replays
+from snapshot import Publisher
+from term_input import EventLoop
+from term_render import TerminalRenderer
+
+parser = argparse.ArgumentParser(description="Play 2048 in the terminal.")
+parser.add_argument('--server', metavar='ADDRESS',
+                    help="play on a game server (server.py) at HOST:PORT or a Unix socket path")
+args = parser.parse_args()
 
 print("Use w,a,s,d to control!")
+print("Use 'l' to show move timings!")
+print("Use 'p' to start and stop profiling!")
 print("Use 'q' to quit!")
 while True:
     try:
         N = max(int(input('input N (larger than or equal to 3): ')), 3)
-        break
     except ValueError:
         print("Please input a number!")
+        continue
+    if not args.server:
+        break
+    try:
+        # Remote games draw their tiles on the server, so they are not recorded.
+        board = RemoteBoard(args.server, N)
+        recorder = None
+        break
+    except ValueError as e:
+        print(f"The server cannot start that game: {e}")
 
-g = np.array([[0 for i in range(N)] for i in range(N)])
-score = 0
-num_cnt = 0
+if not args.server:
+    board = Board(N)
+    recorder = Recorder(board)
+latency = LatencyMonitor('terminal', N)
+profiler = SamplingProfiler('terminal input', waits=['selectors.py:select'])
+profiles = []
+renderer = TerminalRenderer(N)
 start_time = time.time()
 game_over = False
-lock = Lock()
+published = Publisher(board)
 
 def printg():
-    global start_time
-    with lock:
-        os.system('cls' if os.name == 'nt' else 'clear')
-        print(f'YOUR SCORE: {score}\t\t\tTIME: {int(time.time() - start_time)}')
-        print('-' * 6 * N)
-        for i in range(N):
-            for j in range(N):
-                print(g[i][j], end='\t')
-            if i != N - 1:
-                print(end='\n\n')
-        print()
-        print('-' * 6 * N)
-        print('POWERED by JUICE')
-        print('https://github.com/pure-deep-love/mini_games.git')
+    snap = published.latest
+    with latency.stage('render'):
+        renderer.render(snap.tile_rows(), snap.score, int(time.time() - start_time))
 
 def ran_num():
-    a = random.randint(0, N - 1)
-    b = random.randint(0, N - 1)
-    while g[a][b]:
-        a = random.randint(0, N - 1)
-        b = random.randint(0, N - 1)
-    g[a][b] = 2
-
-def compress(arr, st):
-    tmp = np.array([0 for i in range(N)])
-    start, end, step = 0, N, 1
-    j = 0
-    if st == 1:
-        start, end, step = N - 1, -1, -1
-        j = N - 1
-    for i in range(start, end, step):
-        if arr[i] != 0:
-            tmp[j] = arr[i]
-            j = j + 1 if st == 0 else j - 1
-    return tmp
-
-def merge(arr, st):
-    global score, num_cnt
-    tmp = compress(arr, st)
-    start, end, step = 0, N - 1, 1
-    if st == 1:
-        start, end, step = N - 1, 0, -1
-    i = start
-    while (i < end if st == 0 else i > end):
-        if tmp[i] == tmp[i + 1 if st == 0 else i - 1] and tmp[i] != 0:
-            tmp[i] += tmp[i + 1 if st == 0 else i - 1]
-            score += tmp[i]
-            tmp[i + 1 if st == 0 else i - 1] = 0
-            num_cnt -= 1
-        i = i + 1 if st == 0 else i - 1
-    arr = compress(tmp, st)
-    return arr
+    with latency.stage('spawn'):
+        board.spawn()
 
 def move(key):
-    with lock:
-        moved = False
-        if key == 'w':
-            for i in range(N):
-                new_col = merge(g[:, i], 0)
-                if not np.array_equal(g[:, i], new_col):
-                    moved = True
-                g[:, i] = new_col
-        elif key == 's':
-            for i in range(N):
-                new_col = merge(g[:, i], 1)
-                if not np.array_equal(g[:, i], new_col):
-                    moved = True
-                g[:, i] = new_col
-        elif key == 'a':
-            for i in range(N):
-                new_row = merge(g[i, :], 0)
-                if not np.array_equal(g[i, :], new_row):
-                    moved = True
-                g[i, :] = new_row
-        elif key == 'd':
-            for i in range(N):
-                new_row = merge(g[i, :], 1)
-                if not np.array_equal(g[i, :], new_row):
-                    moved = True
-                g[i, :] = new_row
-        return moved
+    with latency.stage('move'):
+        return board.move(key)[0]
 
 def check():
-    with lock:
-        for i in range(N):
-            for j in range(N - 1):
-                if g[i][j] == g[i][j + 1] or g[j][i] == g[j + 1][i]:
-                    return True
-        return False
+    with latency.stage('check'):
+        return board.check()
+
+def show_latency():
+    if latency.visible:
+        renderer.overlay(latency.overlay_lines() + [f"saved to {LATENCY_FILE} on exit"])
 
-def callback(event):
-    global num_cnt
+def callback(key):
     keys = ['w', 'a', 's', 'd', 'q']
     global game_over
-    key = event.name
-    if key in keys:
+    if key == 'q':
+        loop.stop()
+    elif key == 'l':
+        if latency.toggle():
+            show_latency()
+        else:
+            renderer.overlay([])
+    elif key == 'p':
+        if profiler.running():
+            profiles.append(profiler.stop())
+            renderer.overlay([f"profile saved to {profiles[-1]}"])
+        else:
+            profiler.start()
+            renderer.overlay(["profiling, p to stop"])
+    elif key in keys:
+        latency.add('input', time.perf_counter() - loop.key_time)
         moved = move(key)
         if moved:
+            if recorder:
+                recorder.add(key)
             ran_num()
-            num_cnt += 1
+            published.publish(board)
             printg()
-            if num_cnt >= N * N and not check():
+            if not check():
                 print("Game Over!")
                 game_over = True
-                keyboard.unhook_all()
-
-def printg_periodically():
-    global game_over
-    while not game_over:
-        time.sleep(5)
-        printg()
+                loop.stop()
 
 ran_num()
 ran_num()
-num_cnt += 2
+published.publish(board)
 printg()
-keyboard.on_press(callback)
 
-print_thread = Thread(target=printg_periodically)
-print_thread.start()
+loop = EventLoop(callback)
+loop.call_every(5, printg)
+loop.call_every(0.5, show_latency)
+loop.run()
 
-while not game_over:
-    if keyboard.is_pressed('q'):
-        game_over = True
-        keyboard.unhook_all()
+if profiler.running():
+    profiles.append(profiler.stop())
+for path in profiles:
+    print(f"Profile saved to {path}")
+if recorder is None:
+    board.close()
+elif game_over:
+    # As in the GUIs, only finished games are kept as replays.
+    write_replays(REPLAY_FILE, [recorder.replay()], append=True)
+    print(f"Replay saved to {REPLAY_FILE}")
+if latency.shown:
+    latency.export()
+    print(f"Move timings saved to {LATENCY_FILE}")
 
-print_thread.join()
 print("The game has been quit!")
 os.system('pause' if os.name == 'nt' else 'read')
\ No newline at end of file
@@ -1,46 +1,85 @@
 import sys
-import numpy as np
-import random
 import time
-from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QPushButton, QLineEdit, QVBoxLayout, QGridLayout, QWidget, QHBoxLayout, QFrame
-from PyQt5.QtCore import Qt, QTimer, QMutex, QMutexLocker, pyqtSignal
+from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QPushButton, QLineEdit, QVBoxLayout, QWidget, QHBoxLayout, QScrollArea
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from PyQt5.QtGui import QIcon
+from autosave import Session
+from engine import MAX_SIZE, SPAWN, Board
+from history import HISTORY_LIMIT, History
+from lazy import lazy_import
+from snapshot import Publisher
+
+# Only the game window needs these; they load once a game starts, after
+# the size selector is already on screen.
+expectimax = lazy_import('expectimax')
+hint = lazy_import('hint')
+latency = lazy_import('latency')
+move_queue = lazy_import('move_queue')
+profiler = lazy_import('profiler')
+qt_board = lazy_import('qt_board')
+replay = lazy_import('replay')
 
 class Game2048(QMainWindow):
     update_signal = pyqtSignal()
+    hint_signal = pyqtSignal()
 
-    def __init__(self, grid_size):
+    def __init__(self, grid_size, queue_depth=8, queue_policy='drop-newest', session=None, history_limit=HISTORY_LIMIT):
         super().__init__()
         self.grid_size = grid_size
-        self.score = 0
         self.start_time = time.time()
         self.game_over = False
-        self.mutex = QMutex()
-        self.grid = np.zeros((grid_size, grid_size), dtype=int)
-        self.cooldown = False
+        if session is None:
+            self.board = Board(grid_size)
+            self.recorder = replay.Recorder(self.board)
+        else:
+            self.board = session.restore()
+            self.recorder = session.recorder(self.board)
+            self.start_time -= session.elapsed
+        self.published = Publisher(self.board)
+        self.moves = move_queue.MoveQueue(queue_depth, queue_policy)
+        self.history = History(history_limit)
+        self.frame_pending = False
+        self.motions = None
         self.key_pressed = set()
         self.valid_keys = [Qt.Key_W, Qt.Key_A, Qt.Key_S, Qt.Key_D, Qt.Key_Up, Qt.Key_Down, Qt.Key_Left, Qt.Key_Right]
-        self.num_count = 0
+        self.key_map = {Qt.Key_W: 'w', Qt.Key_Up: 'w', Qt.Key_A: 'a', Qt.Key_Left: 'a',
+                        Qt.Key_S: 's', Qt.Key_Down: 's', Qt.Key_D: 'd', Qt.Key_Right: 'd'}
+        self.ai = None
+        self.ai_running = False
+        self.hints = None
+        self.hint_on = False
+        self.profiler = None
+        self.latency = latency.LatencyMonitor('qt', grid_size)
+        self.input_time = None
 
         self.setup_ui()
-        self.add_random_tile()
-        self.add_random_tile()
-        self.num_count += 2
+        if session is None:
+            self.add_random_tile()
+            self.add_random_tile()
+            session = Session.create(self.board)
+            self.published.publish(self.board)
+        self.session = session
         self.update_display()
 
         self.update_signal.connect(self.update_display_info)
+        # Emitted from the search thread; Qt queues it to this one.
+        self.hint_signal.connect(self.show_hint)
 
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_timer)
         self.timer.start(1000)
 
+        self.latency_timer = QTimer()
+        self.latency_timer.timeout.connect(self.update_latency)
+
     def setup_ui(self):
         self.setWindowTitle("2048 Game")
         self.setWindowIcon(QIcon("R-C.ico"))
 
-        cell_size = 606 // self.grid_size
-        window_width = cell_size * self.grid_size + 20
-        window_height = cell_size * self.grid_size + 150
+        cell_size = 606 // min(self.grid_size, qt_board.MAX_FULL_SIZE)
+        view_size = cell_size * min(self.grid_size, qt_board.MAX_FULL_SIZE)
+        window_width = view_size + 20
+        window_height = view_size + 150
 
         self.setGeometry(300, 300, window_width, window_height)
         self.setFixedSize(window_width, window_height)
@@ -48,7 +87,7 @@ class Game2048(QMainWindow):
         main_layout = QVBoxLayout()
 
         top_layout = QHBoxLayout()
-        self.score_label = QLabel(f"SCORE: {self.score}")
+        self.score_label = QLabel(f"SCORE: {self.board.score}")
         self.score_label.setStyleSheet("font-size: 25px;")
         top_layout.addWidget(self.score_label)
 
@@ -57,6 +96,12 @@ class Game2048(QMainWindow):
         self.time_label.setAlignment(Qt.AlignRight)
         top_layout.addWidget(self.time_label)
 
+        self.hint_label = QLabel()
+        self.hint_label.setStyleSheet("font-size: 25px; color: #1565c0;")
+        self.hint_label.setAlignment(Qt.AlignCenter)
+        self.hint_label.setVisible(False)
+        top_layout.insertWidget(1, self.hint_label)
+
         self.game_over_label = QLabel()
         self.game_over_label.setStyleSheet("font-size: 30px; color: red;")
         self.game_over_label.setAlignment(Qt.AlignCenter)
@@ -67,8 +112,14 @@ class Game2048(QMainWindow):
         self.new_game_button.clicked.connect(self.start_new_game)
         self.new_game_button.setVisible(False)
 
-        self.grid_layout = QGridLayout()
-        self.grid_layout.setSpacing(0)
+        self.board_view = qt_board.BoardWidget(self.grid_size, cell_size)
+        self.board_view.latency = self.latency
+        self.scroll_area = None
+        if self.grid_size > qt_board.MAX_FULL_SIZE:
+            self.scroll_area = QScrollArea()
+            self.scroll_area.setWidget(self.board_view)
+            self.scroll_area.setFixedSize(view_size, view_size)
+            self.scroll_area.setFocusPolicy(Qt.NoFocus)
 
         bottom_layout = QHBoxLayout()
         self.credit_label1 = QLabel("POWERED by JUICE")
@@ -80,7 +131,7 @@ class Game2048(QMainWindow):
         bottom_layout.addWidget(self.credit_label2)
 
         main_layout.addLayout(top_layout)
-        main_layout.addLayout(self.grid_layout)
+        main_layout.addWidget(self.scroll_area or self.board_view, alignment=Qt.AlignCenter)
         main_layout.addWidget(self.game_over_label)
         main_layout.addWidget(self.new_game_button)
         main_layout.addLayout(bottom_layout)
@@ -89,43 +140,24 @@ class Game2048(QMainWindow):
         container.setLayout(main_layout)
         self.setCentralWidget(container)
 
+        self.latency_label = QLabel(self)
+        self.latency_label.setStyleSheet(
+            "font-family: monospace; font-size: 13px; color: white; background: rgba(0, 0, 0, 160); padding: 4px;")
+        self.latency_label.move(10, 50)
+        self.latency_label.setVisible(False)
+
     def update_display_info(self):
-        with QMutexLocker(self.mutex):
-            self.score_label.setText(f"SCORE: {self.score}")
-            self.time_label.setText(f"TIME: {int(time.time() - self.start_time)}")
-            if self.game_over:
-                self.game_over_label.setText("Game Over!")
-                self.game_over_label.setVisible(True)
-                self.new_game_button.setVisible(True)
+        self.score_label.setText(f"SCORE: {self.published.latest.score}")
+        self.time_label.setText(f"TIME: {int(time.time() - self.start_time)}")
+        if self.game_over:
+            self.game_over_label.setText("Game Over!")
+            self.game_over_label.setVisible(True)
+            self.new_game_button.setVisible(True)
 
     def update_display(self):
-        cell_size = 606 // self.grid_size
-
-        for i in range(self.grid_size):
-            for j in range(self.grid_size):
-                item = self.grid_layout.itemAtPosition(i, j)
-                if item is not None:
-                    widget = item.widget()
-                    if widget is not None:
-                        widget.deleteLater()
-
-        self.grid_layout.setSpacing(0)
-        for i in range(self.grid_size):
-            for j in range(self.grid_size):
-                frame = QFrame(self)
-                frame.setFixedSize(cell_size, cell_size)
-                frame.setFrameShape(QFrame.Box)
-                frame.setLineWidth(2)
-                if self.grid[i][j] != 0:
-                    frame.setStyleSheet("background-color: white;")
-                    label = QLabel(str(self.grid[i][j]), self)
-                    label.setAlignment(Qt.AlignCenter)
-                    label.setStyleSheet("font-size: 20px;")
-                    self.grid_layout.addWidget(frame, i, j)
-                    self.grid_layout.addWidget(label, i, j)
-                else:
-                    frame.setStyleSheet("background-color: #d9d9d9;")
-                    self.grid_layout.addWidget(frame, i, j)
+        with self.latency.stage('render'):
+            self.board_view.set_board(self.published.latest.exponents(), self.motions)
+        self.motions = None
 
         if self.game_over:
             self.game_over_label.setGeometry(
@@ -144,98 +176,211 @@ class Game2048(QMainWindow):
             self.new_game_button.setVisible(False)
 
     def add_random_tile(self):
-        x, y = random.randint(0, self.grid_size - 1), random.randint(0, self.grid_size - 1)
-        while self.grid[x][y] != 0:
-            x, y = random.randint(0, self.grid_size - 1), random.randint(0, self.grid_size - 1)
-        self.grid[x][y] = 2
-
-    def compress(self, row_or_col, direction):
-        temp = np.zeros(self.grid_size, dtype=int)
-        index = 0 if direction == 0 else self.grid_size - 1
-        for i in range(self.grid_size):
-            if row_or_col[i] != 0:
-                temp[index] = row_or_col[i]
-                index = index + 1 if direction == 0 else index - 1
-        return temp
-
-    def merge(self, row_or_col, direction):
-        temp = self.compress(row_or_col, direction)
-        for i in range(self.grid_size - 1):
-            if temp[i] == temp[i + 1] and temp[i] != 0:
-                temp[i] *= 2
-                self.score += temp[i]
-                temp[i + 1] = 0
-                self.num_count -= 1
-        return self.compress(temp, direction)
-
-    def move(self, direction_key):
-        with QMutexLocker(self.mutex):
-            moved = False
-            if direction_key.key() == Qt.Key_W or direction_key.key() == Qt.Key_Up:
-                for i in range(self.grid_size):
-                    new_col = self.merge(self.grid[:, i], 0)
-                    if not np.array_equal(self.grid[:, i], new_col):
-                        moved = True
-                    self.grid[:, i] = new_col
-            elif direction_key.key() == Qt.Key_S or direction_key.key() == Qt.Key_Down:
-                for i in range(self.grid_size):
-                    new_col = self.merge(self.grid[:, i], 1)
-                    if not np.array_equal(self.grid[:, i], new_col):
-                        moved = True
-                    self.grid[:, i] = new_col
-            elif direction_key.key() == Qt.Key_A or direction_key.key() == Qt.Key_Left:
-                for i in range(self.grid_size):
-                    new_row = self.merge(self.grid[i, :], 0)
-                    if not np.array_equal(self.grid[i, :], new_row):
-                        moved = True
-                    self.grid[i, :] = new_row
-            elif direction_key.key() == Qt.Key_D or direction_key.key() == Qt.Key_Right:
-                for i in range(self.grid_size):
-                    new_row = self.merge(self.grid[i, :], 1)
-                    if not np.array_equal(self.grid[i, :], new_row):
-                        moved = True
-                    self.grid[i, :] = new_row
-            return moved
+        with self.latency.stage('spawn'):
+            return self.board.spawn()
+
+    def move(self, key):
+        with self.latency.stage('move'):
+            return self.board.move(key)[0]
 
     def check_game_status(self):
-        if np.any(self.grid == 0):
-            return True
-        for i in range(self.grid_size):
-            for j in range(self.grid_size - 1):
-                if self.grid[i][j] == self.grid[i][j + 1] or self.grid[j][i] == self.grid[j + 1][i]:
-                    return True
-        return False
+        with self.latency.stage('check'):
+            return self.board.check()
 
     def keyPressEvent(self, event):
-        if self.cooldown or self.game_over:
+        if self.game_over:
             return
 
         if event.key() in self.valid_keys:
             self.key_pressed.add(event.key())
 
     def keyReleaseEvent(self, event):
-        if self.cooldown or self.game_over:
+        if self.game_over:
+            return
+
+        if event.key() == Qt.Key_I:
+            self.toggle_ai()
+            return
+
+        if event.key() == Qt.Key_L:
+            self.toggle_latency()
+            return
+
+        if event.key() == Qt.Key_H:
+            self.toggle_hint()
+            return
+
+        if event.key() == Qt.Key_P:
+            self.toggle_profiler()
+            return
+
+        if event.key() in (Qt.Key_U, Qt.Key_R) and not self.ai_running:
+            self.undo(redo=event.key() == Qt.Key_R)
+            return
+
+        if self.scroll_area is not None and event.key() in (Qt.Key_Plus, Qt.Key_Equal, Qt.Key_Minus):
+            factor = 0.8 if event.key() == Qt.Key_Minus else 1.25
+            self.board_view.set_cell_size(int(self.board_view.cell_size * factor))
+            return
+
+        if self.ai_running:
             return
 
         if event.key() in self.valid_keys and event.key() in self.key_pressed:
             self.key_pressed.discard(event.key())
-            if not self.cooldown:
-                self.cooldown = True
-                moved = self.move(event)
-                if moved:
-                    self.add_random_tile()
-                    self.num_count += 1
-                    self.update_display()
-                    if not self.check_game_status():
-                        self.game_over = True
-                        self.timer.stop()
-                        self.update_display_info()
-                QTimer.singleShot(120, self.reset_cooldown)
-
-    def reset_cooldown(self):
-        self.cooldown = False
+            if self.input_time is None:
+                self.input_time = time.perf_counter()
+            self.moves.push(self.key_map[event.key()])
+            if not self.frame_pending:
+                self.flush_moves()
+
+    def flush_moves(self):
+        # Apply every queued move, then draw once. A key is played as soon
+        # as it comes in; only keys that arrive within FRAME_MS of a redraw
+        # wait in the queue, for the timer that ends that frame.
+        self.frame_pending = False
+        if self.input_time is not None:
+            self.latency.add('input', time.perf_counter() - self.input_time)
+            self.input_time = None
+        moved = False
+        for key in self.moves.drain():
+            if self.apply(key):
+                moved = True
+        if moved:
+            self.after_moves()
+            if not self.game_over:
+                self.frame_pending = True
+                QTimer.singleShot(move_queue.FRAME_MS, self.flush_moves)
+
+    def play(self, key):
+        if self.apply(key):
+            self.after_moves()
+
+    def apply(self, key):
+        # Of several moves applied before one redraw only the last is
+        # animated; the display snaps through the others.
+        before, score = self.board.state(), self.board.score
+        motions = self.board.motions(key) if self.board_view.animated else None
+        moved = self.move(key)
+        if moved:
+            if self.recorder:
+                self.recorder.add(key)
+            cell = self.add_random_tile()
+            self.published.publish(self.board)
+            if motions is not None and cell is not None:
+                motions.append((cell, cell, 0, SPAWN))
+            self.motions = motions
+            self.history.push(before, score, self.board)
+            with self.latency.stage('save'):
+                self.session.update(self.board, key)
+        return moved
+
+    def after_moves(self):
+        self.update_display()
+        if not self.check_game_status():
+            self.game_over = True
+            self.ai_running = False
+            self.set_hint(None)
+            if self.recorder:
+                replay.write_replays(replay.REPLAY_FILE, [self.recorder.replay()], append=True)
+            self.session.finish()
+            self.timer.stop()
+            self.update_display_info()
+        else:
+            self.request_hint()
+
+    def undo(self, redo=False):
+        done = self.history.redo(self.board) if redo else self.history.undo(self.board)
+        if done:
+            self.published.publish(self.board)
+            # Undone games draw different tiles than a replay would.
+            self.recorder = None
+            self.session.rewind(self.board)
+            self.update_display()
+            self.update_display_info()
+            self.request_hint()
+
+    def toggle_ai(self):
+        if self.ai is None:
+            self.ai = expectimax.Expectimax()
+        self.ai_running = not self.ai_running
+        if self.ai_running:
+            QTimer.singleShot(0, self.ai_step)
+
+    def ai_step(self):
+        if not self.ai_running or self.game_over:
+            return
+        key = self.ai.best_move(self.board)
+        if key is None:
+            self.ai_running = False
+            return
+        self.play(key)
+        QTimer.singleShot(20, self.ai_step)
+
+    def toggle_hint(self):
+        self.hint_on = not self.hint_on
+        if self.hint_on:
+            if self.hints is None:
+                self.hints = hint.HintSearch(notify=self.hint_signal.emit)
+            self.request_hint()
+        else:
+            self.set_hint(None)
+
+    def request_hint(self):
+        # Called whenever the board changes: the last search is dropped and
+        # the hint shows as soon as the new one is done.
+        if self.hint_on:
+            key = self.hints.request(self.board)
+            self.set_hint(key, searching=key is None)
+
+    def show_hint(self):
+        result = self.hints.poll() if self.hint_on else None
+        if result is not None and result[0] == self.board.state():
+            self.set_hint(result[1])
+
+    def set_hint(self, key, searching=False):
+        if key is None and not searching:
+            if self.hints is not None:
+                self.hints.cancel()
+            self.hint_label.setVisible(False)
+            return
+        self.hint_label.setText("HINT: ..." if searching else f"HINT: {hint.ARROWS[key]}")
+        self.hint_label.setVisible(True)
+
+    def toggle_profiler(self):
+        if self.profiler is None:
+            self.profiler = profiler.SamplingProfiler('Qt event loop')
+        if self.profiler.running():
+            self.setWindowTitle(f"2048 Game - profile saved to {self.profiler.stop()}")
+        else:
+            self.profiler.start()
+            self.setWindowTitle("2048 Game - profiling, p to stop")
+
+    def toggle_latency(self):
+        if self.latency.toggle():
+            self.update_latency()
+            self.latency_label.setVisible(True)
+            self.latency_label.raise_()
+            self.latency_timer.start(500)
+        else:
+            self.latency_timer.stop()
+            self.latency_label.setVisible(False)
+
+    def update_latency(self):
+        lines = self.latency.overlay_lines() + [f"saved to {latency.LATENCY_FILE} on exit"]
+        self.latency_label.setText('\n'.join(lines))
+        self.latency_label.adjustSize()
+
+    def closeEvent(self, event):
+        self.latency.export_if_shown()
+        if self.hints is not None:
+            self.hints.close()
+        if self.profiler is not None and self.profiler.running():
+            self.profiler.stop()
+        super().closeEvent(event)
 
     def update_timer(self):
+        self.session.tick(time.time() - self.start_time)
         self.update_signal.emit()
 
     def start_new_game(self):
@@ -258,7 +403,7 @@ class SizeSelector(QMainWindow):
         self.title_label.setAlignment(Qt.AlignCenter)
         layout.addWidget(self.title_label)
 
-        self.size_label = QLabel("Enter grid size (3 <= size <= 20):")
+        self.size_label = QLabel(f"Enter grid size (3 <= size <= {MAX_SIZE}):")
         self.size_label.setStyleSheet("font-size: 20px;")
         self.size_label.setAlignment(Qt.AlignCenter)
         layout.addWidget(self.size_label)
@@ -267,7 +412,7 @@ class SizeSelector(QMainWindow):
         self.size_input.setStyleSheet("font-size: 20px;")
         layout.addWidget(self.size_input)
 
-        self.control_label = QLabel("Use w, a, s, d or arrow keys to control!", self)
+        self.control_label = QLabel("Use w, a, s, d or arrow keys to control, i to toggle the AI,\nh for hints, u/r to undo/redo, l for move timings,\np to profile, +/- to zoom big boards!", self)
         self.control_label.setAlignment(Qt.AlignCenter)
         self.control_label.setStyleSheet("font-size: 20px;")
         layout.addWidget(self.control_label)
@@ -277,21 +422,36 @@ class SizeSelector(QMainWindow):
         self.start_button.clicked.connect(self.start_game)
         layout.addWidget(self.start_button)
 
+        self.session = Session.open()
+        if self.session is not None:
+            self.resume_button = QPushButton(
+                f"Resume {self.session.size}x{self.session.size} game (score {self.session.score})", self)
+            self.resume_button.setStyleSheet("font-size: 16px;")
+            self.resume_button.clicked.connect(self.resume_game)
+            layout.addWidget(self.resume_button)
+
         container = QWidget()
         container.setLayout(layout)
         self.setCentralWidget(container)
         self.setGeometry(400, 400, 400, 300)
         self.show()
 
+    def resume_game(self):
+        self.game_window = Game2048(self.session.size, session=self.session)
+        self.game_window.show()
+        self.close()
+
     def start_game(self):
         try:
             size = int(self.size_input.text())
-            if 3 <= size <= 20:
+            if 3 <= size <= MAX_SIZE:
+                if self.session is not None:
+                    self.session.close()
                 self.game_window = Game2048(size)
                 self.game_window.show()
                 self.close()
             else:
-                self.size_label.setText("Please enter a number between 3 and 20.")
+                self.size_label.setText(f"Please enter a number between 3 and {MAX_SIZE}.")
         except ValueError:
             self.size_label.setText("Invalid input! Please enter a number.")
 
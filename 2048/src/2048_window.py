@@ -1,36 +1,68 @@
 import tkinter as tk
-import numpy as np
-import random
 import time
-from threading import Thread, Lock
+from autosave import Session
+from engine import MAX_SIZE, Board
+from history import HISTORY_LIMIT, History
+from expectimax import Expectimax
+from hint import ARROWS, HINT_POLL_MS, HintSearch
+from latency import LATENCY_FILE, LatencyMonitor
+from move_queue import FRAME_MS, MoveQueue
+from profiler import SamplingProfiler
+from replay import REPLAY_FILE, Recorder, write_replays
+from snapshot import Publisher
+from tk_board import MAX_FULL_SIZE, BoardView
 
 class Game2048:
-    def __init__(self, root, size):
+    def __init__(self, root, size, queue_depth=8, queue_policy='drop-newest', session=None, history_limit=HISTORY_LIMIT):
         self.root = root
         self.size = size
-        self.score = 0
         self.start_time = time.time()
         self.game_over = False
-        self.lock = Lock()
-        self.grid = np.zeros((size, size), dtype=int)
-        self.cooldown = False
+        if session is None:
+            self.board = Board(size)
+            self.recorder = Recorder(self.board)
+        else:
+            self.board = session.restore()
+            self.recorder = session.recorder(self.board)
+            self.start_time -= session.elapsed
+        self.published = Publisher(self.board)
+        self.moves = MoveQueue(queue_depth, queue_policy)
+        self.history = History(history_limit)
+        self.frame_pending = False
         self.key_of_press = set()
         self.keys = ['w', 'a', 's', 'd']
-        self.num_cnt = 0
+        self.ai = None
+        self.ai_running = False
+        self.hints = None
+        self.hint_on = False
+        self.hint_searching = False
+        self.hint_job = None
+        self.profiler = SamplingProfiler('Tk event loop')
+        self.latency = LatencyMonitor('tk', size)
+        self.input_time = None
 
         self.root.title("2048 Game")
         
         self.top_frame = tk.Frame(self.root)
         self.top_frame.grid(row=0, column=0, columnspan=2, pady=10)
 
-        self.score_label = tk.Label(self.top_frame, text=f"YOUR SCORE: {self.score}", font=("Helvetica Neue", 20))
+        self.score_label = tk.Label(self.top_frame, text=f"YOUR SCORE: {self.board.score}", font=("Helvetica Neue", 20))
         self.score_label.grid(row=0, column=0, padx=20, sticky=tk.W)
 
         self.time_label = tk.Label(self.top_frame, text=f"TIME: {int(time.time() - self.start_time)}", font=("Helvetica Neue", 20))
         self.time_label.grid(row=0, column=1, padx=20, sticky=tk.W)
 
-        self.canvas = tk.Canvas(self.root, width=606, height=606)
-        self.canvas.grid(row=1, column=0, columnspan=2)
+        self.hint_label = tk.Label(self.top_frame, text="", fg="#1565c0", font=("Helvetica Neue", 20))
+        self.hint_label.grid(row=0, column=2, padx=20, sticky=tk.W)
+
+        self.view = None
+        if size > MAX_FULL_SIZE:
+            self.view = BoardView(self.root, size)
+            self.view.frame.grid(row=1, column=0, columnspan=2)
+            self.canvas = self.view.canvas
+        else:
+            self.canvas = tk.Canvas(self.root, width=606, height=606)
+            self.canvas.grid(row=1, column=0, columnspan=2)
 
         self.bottom_frame = tk.Frame(self.root)
         self.bottom_frame.grid(row=2, column=0, columnspan=2, pady=10)
@@ -41,127 +73,260 @@ class Game2048:
         self.credit_label2 = tk.Label(self.bottom_frame, text="https://github.com/pure-deep-love/mini_games.git", font=("Helvetica Neue", 12))
         self.credit_label2.grid(row=3, column=1, padx=10, sticky=tk.W)
 
+        if self.view is None:
+            self.create_cells()
+        self.shown = None
+
         self.root.bind("<KeyPress>", self.key_press)
         self.root.bind("<KeyRelease>", self.key_release)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
         
-        self.ran_num()
-        self.ran_num()
-        self.num_cnt += 2
+        if session is None:
+            self.ran_num()
+            self.ran_num()
+            session = Session.create(self.board)
+            self.published.publish(self.board)
+        self.session = session
         self.printg()
-
-        self.print_thread = Thread(target=self.printg_periodically)
-        self.print_thread.start()
+        self.root.after(1000, self.save_time)
 
     def printg_above(self):
-        with self.lock:
-            self.score_label.config(text=f"YOUR SCORE: {self.score}")
-            self.time_label.config(text=f"TIME: {int(time.time() - self.start_time)}")
+        self.score_label.config(text=f"YOUR SCORE: {self.published.latest.score}")
+        self.time_label.config(text=f"TIME: {int(time.time() - self.start_time)}")
 
-    def printg(self):
-        self.printg_above()    
-        self.canvas.delete("all")
+    def create_cells(self):
         cell_width = 600 // self.size
+        self.cell_texts = []
         for i in range(self.size):
+            row = []
             for j in range(self.size):
                 x0, y0 = j * cell_width + 3, i * cell_width + 3
                 x1, y1 = x0 + cell_width, y0 + cell_width
                 self.canvas.create_rectangle(x0, y0, x1, y1, fill="white", outline="black")
-                if self.grid[i][j] != 0:
-                    self.canvas.create_text((x0 + x1) / 2, (y0 + y1) / 2, text=str(self.grid[i][j]), font=("Helvetica Neue", 20))
+                row.append(self.canvas.create_text((x0 + x1) / 2, (y0 + y1) / 2, text="", font=("Helvetica Neue", 20)))
+            self.cell_texts.append(row)
+
+    def printg(self):
+        # Draws the latest snapshot, not the board the moves are played on.
+        snap = self.published.latest
+        with self.latency.stage('render'):
+            self.printg_above()
+            if self.view is not None:
+                self.view.set_board(snap.exponents())
+            else:
+                rows = snap.tile_rows()
+                for i, j in snap.changed_cells(self.shown):
+                    self.canvas.itemconfig(self.cell_texts[i][j], text=str(rows[i][j]) if rows[i][j] else "")
+                self.shown = snap
+        # Tk redraws the canvas from an idle handler queued by the changes
+        # above, so the next idle callback runs once it has painted.
+        self.root.after_idle(self.painted, time.perf_counter())
+
+    def painted(self, start):
+        self.latency.add('paint', time.perf_counter() - start)
 
     def ran_num(self):
-        a, b = random.randint(0, self.size - 1), random.randint(0, self.size - 1)
-        while self.grid[a][b] != 0:
-            a, b = random.randint(0, self.size - 1), random.randint(0, self.size - 1)
-        self.grid[a][b] = 2
-
-    def compress(self, arr, st):
-        tmp = np.zeros(self.size, dtype=int)
-        j = 0 if st == 0 else self.size - 1
-        for i in range(self.size):
-            if arr[i] != 0:
-                tmp[j] = arr[i]
-                j = j + 1 if st == 0 else j - 1
-        return tmp
-
-    def merge(self, arr, st):
-        tmp = self.compress(arr, st)
-        for i in range(self.size - 1):
-            if tmp[i] == tmp[i + 1] and tmp[i] != 0:
-                tmp[i] *= 2
-                self.score += tmp[i]
-                tmp[i + 1] = 0
-                self.num_cnt -= 1
-        return self.compress(tmp, st)
+        with self.latency.stage('spawn'):
+            self.board.spawn()
 
     def move(self, key):
-        with self.lock:
-            moved = False
-            if key == 'w':
-                for i in range(self.size):
-                    new_col = self.merge(self.grid[:, i], 0)
-                    if not np.array_equal(self.grid[:, i], new_col):
-                        moved = True
-                    self.grid[:, i] = new_col
-            elif key == 's':
-                for i in range(self.size):
-                    new_col = self.merge(self.grid[:, i], 1)
-                    if not np.array_equal(self.grid[:, i], new_col):
-                        moved = True
-                    self.grid[:, i] = new_col
-            elif key == 'a':
-                for i in range(self.size):
-                    new_row = self.merge(self.grid[i, :], 0)
-                    if not np.array_equal(self.grid[i, :], new_row):
-                        moved = True
-                    self.grid[i, :] = new_row
-            elif key == 'd':
-                for i in range(self.size):
-                    new_row = self.merge(self.grid[i, :], 1)
-                    if not np.array_equal(self.grid[i, :], new_row):
-                        moved = True
-                    self.grid[i, :] = new_row
-            return moved
+        with self.latency.stage('move'):
+            return self.board.move(key)[0]
 
     def check(self):
-        for i in range(self.size):
-            for j in range(self.size - 1):
-                if self.grid[i][j] == self.grid[i][j + 1] or self.grid[j][i] == self.grid[j + 1][i]:
-                    return True
-        return False
+        with self.latency.stage('check'):
+            return self.board.check()
 
     def key_press(self, event):
-        if self.cooldown:
-            return
-
         if event.char in self.keys:
             self.key_of_press.add(event.char)
 
     def key_release(self, event):
-        if self.cooldown:
+        if event.char == 'i':
+            self.toggle_ai()
+            return
+
+        if event.char == 'l':
+            self.toggle_latency()
+            return
+
+        if event.char == 'h':
+            self.toggle_hint()
+            return
+
+        if event.char == 'p':
+            self.toggle_profiler()
+            return
+
+        if event.char in ('u', 'r') and not self.ai_running:
+            self.undo(redo=event.char == 'r')
+            return
+
+        if self.view is not None and event.char in ('+', '=', '-'):
+            self.view.zoom(0.8 if event.char == '-' else 1.25)
+            return
+
+        if self.ai_running:
             return
 
-        if event.char in self.keys and event.char in self.key_of_press:    
-            self.cooldown = True 
-            moved = self.move(event.char)
-            if moved:
-                self.ran_num()
-                self.num_cnt += 1
-                self.printg()
-                if self.num_cnt >= self.size * self.size and not self.check():
-                    self.game_over = True
-                    self.root.unbind("<KeyPress>")
-                    self.root.unbind("<KeyRelease>")
-                    self.canvas.create_text(300, 350, text="Game Over!", font=("Helvetica Neue", 40), fill="red")
-            self.root.after(120, self.reset_cooldown)
-
-    def reset_cooldown(self):
-        self.cooldown = False
-
-    def printg_periodically(self):
-        while not self.game_over:
-            time.sleep(1)
+        if event.char in self.keys and event.char in self.key_of_press:
+            if self.input_time is None:
+                self.input_time = time.perf_counter()
+            self.moves.push(event.char)
+            if not self.frame_pending:
+                self.flush_moves()
+
+    def flush_moves(self):
+        # Keys are played as they come in, except during the FRAME_MS after
+        # a redraw: those queue up for the after() call that ends the frame
+        # and are drawn together.
+        self.frame_pending = False
+        if self.input_time is not None:
+            self.latency.add('input', time.perf_counter() - self.input_time)
+            self.input_time = None
+        moved = False
+        for key in self.moves.drain():
+            if self.apply(key):
+                moved = True
+        if moved:
+            self.after_moves()
+            if not self.game_over:
+                self.frame_pending = True
+                self.root.after(FRAME_MS, self.flush_moves)
+
+    def play(self, key):
+        if self.apply(key):
+            self.after_moves()
+
+    def apply(self, key):
+        before, score = self.board.state(), self.board.score
+        moved = self.move(key)
+        if moved:
+            if self.recorder:
+                self.recorder.add(key)
+            self.ran_num()
+            self.published.publish(self.board)
+            self.history.push(before, score, self.board)
+            with self.latency.stage('save'):
+                self.session.update(self.board, key)
+        return moved
+
+    def after_moves(self):
+        self.printg()
+        if not self.check():
+            self.game_over = True
+            self.ai_running = False
+            self.set_hint(None)
+            if self.recorder:
+                write_replays(REPLAY_FILE, [self.recorder.replay()], append=True)
+            self.session.finish()
+            self.root.unbind("<KeyPress>")
+            self.root.unbind("<KeyRelease>")
+            self.canvas.create_text(300, 350, text="Game Over!", font=("Helvetica Neue", 40), fill="red")
+        else:
+            self.request_hint()
+
+    def undo(self, redo=False):
+        done = self.history.redo(self.board) if redo else self.history.undo(self.board)
+        if done:
+            self.published.publish(self.board)
+            # Undone games draw different tiles than a replay would.
+            self.recorder = None
+            self.session.rewind(self.board)
+            self.printg()
+            self.request_hint()
+
+    def toggle_ai(self):
+        if self.ai is None:
+            self.ai = Expectimax()
+        self.ai_running = not self.ai_running
+        if self.ai_running:
+            self.root.after(0, self.ai_step)
+
+    def ai_step(self):
+        if not self.ai_running or self.game_over:
+            return
+        key = self.ai.best_move(self.board)
+        if key is None:
+            self.ai_running = False
+            return
+        self.play(key)
+        self.root.after(20, self.ai_step)
+
+    def toggle_hint(self):
+        self.hint_on = not self.hint_on
+        if self.hint_on:
+            if self.hints is None:
+                self.hints = HintSearch()
+            self.request_hint()
+        else:
+            self.set_hint(None)
+
+    def request_hint(self):
+        # Called whenever the board changes: the last search is dropped and
+        # poll_hint shows the new one once it is done. Tk may only be used
+        # from this thread, so the search thread is polled, not waited on.
+        if self.hint_on:
+            key = self.hints.request(self.board)
+            self.set_hint(key, searching=key is None)
+            if key is None and self.hint_job is None:
+                self.hint_job = self.root.after(HINT_POLL_MS, self.poll_hint)
+
+    def poll_hint(self):
+        self.hint_job = None
+        if not self.hint_searching:
+            return
+        result = self.hints.poll()
+        if result is None:
+            self.hint_job = self.root.after(HINT_POLL_MS, self.poll_hint)
+        elif result[0] == self.board.state():
+            self.set_hint(result[1])
+
+    def set_hint(self, key, searching=False):
+        self.hint_searching = searching
+        if key is None and not searching:
+            if self.hints is not None:
+                self.hints.cancel()
+            self.hint_label.config(text="")
+            return
+        self.hint_label.config(text="HINT: ..." if searching else f"HINT: {ARROWS[key]}")
+
+    def toggle_profiler(self):
+        if self.profiler.running():
+            self.root.title(f"2048 Game - profile saved to {self.profiler.stop()}")
+        else:
+            self.profiler.start()
+            self.root.title("2048 Game - profiling, p to stop")
+
+    def toggle_latency(self):
+        if self.latency.toggle():
+            self.update_latency()
+        else:
+            self.root.after_cancel(self.latency_job)
+            self.canvas.delete("latency")
+
+    def update_latency(self):
+        self.canvas.delete("latency")
+        lines = self.latency.overlay_lines() + [f"saved to {LATENCY_FILE} on exit"]
+        text = self.canvas.create_text(10, 10, text="\n".join(lines), anchor=tk.NW, font=("Courier", 11),
+                                       fill="white", tags="latency")
+        self.canvas.tag_lower(self.canvas.create_rectangle(self.canvas.bbox(text), fill="black", tags="latency"), text)
+        self.latency_job = self.root.after(500, self.update_latency)
+
+    def close(self):
+        self.latency.export_if_shown()
+        if self.hints is not None:
+            self.hints.close()
+        if self.profiler.running():
+            self.profiler.stop()
+        self.root.destroy()
+
+    def save_time(self):
+        # Once a second on the Tk thread: the clock label and the autosave.
+        if not self.game_over:
             self.printg_above()
+            self.session.tick(time.time() - self.start_time)
+            self.root.after(1000, self.save_time)
 
 class SizeSelector:
     def __init__(self, root):
@@ -171,27 +336,42 @@ class SizeSelector:
         self.label_2048 = tk.Label(self.root, text="2048", font=("Helvetica Neue", 32))
         self.label_2048.grid(row=0, column=0, columnspan=2, pady=20)
 
-        self.label_1 = tk.Label(self.root, text="Enter grid size (3 <= size <= 20):", font=("Helvetica Neue", 16))
+        self.label_1 = tk.Label(self.root, text=f"Enter grid size (3 <= size <= {MAX_SIZE}):", font=("Helvetica Neue", 16))
         self.label_1.grid(row=1, column=0, pady=20)
 
         self.entry = tk.Entry(self.root, font=("Helvetica Neue", 16))
         self.entry.grid(row=1, column=1, pady=20)
 
-        self.label_2 = tk.Label(self.root, text="Use w,a,s,d to control!", font=("Helvetica Neue", 16))
+        self.label_2 = tk.Label(self.root, text="Use w,a,s,d to control, i to toggle the AI,\nh for hints, u/r to undo/redo, l for move timings,\np to profile, +/- to zoom big boards!", font=("Helvetica Neue", 16))
         self.label_2.grid(row=2, column=0, columnspan=2, pady=20)
 
         self.button = tk.Button(self.root, text="Start Game", font=("Helvetica Neue", 16), command=self.start_game)
         self.button.grid(row=3, column=0, columnspan=2, pady=20)
 
+        self.session = Session.open()
+        if self.session is not None:
+            self.resume_button = tk.Button(
+                self.root, text=f"Resume {self.session.size}x{self.session.size} game (score {self.session.score})",
+                font=("Helvetica Neue", 16), command=self.resume_game)
+            self.resume_button.grid(row=4, column=0, columnspan=2, pady=(0, 20))
+
+    def resume_game(self):
+        self.root.destroy()
+        root = tk.Tk()
+        game = Game2048(root, self.session.size, session=self.session)
+        root.mainloop()
+
     def start_game(self):
         try:
-            size = min(max(int(self.entry.get()), 3), 20)
+            size = min(max(int(self.entry.get()), 3), MAX_SIZE)
+            if self.session is not None:
+                self.session.close()
             self.root.destroy()
             root = tk.Tk()
             game = Game2048(root, size)
             root.mainloop()
         except ValueError:
-            self.label.config(text="Please enter a valid number (3 <= size <= 20).")
+            self.label_1.config(text=f"Please enter a valid number (3 <= size <= {MAX_SIZE}).")
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,169 @@
+import mmap
+import struct
+from array import array
+from engine import KEYS, MAX_INDEXED_SIZE, Board
+from lazy import lazy_import
+
+np = lazy_import('numpy')
+# Only needed to resume the replay of a restored game.
+replay = lazy_import('replay')
+
+SESSION_FILE = 'session.2048s'
+MAGIC = b'2SES'
+VERSION = 2
+# Session flags.
+FINISHED = 1
+# An undo or redo broke the link between the move log and the board.
+UNDONE = 2
+# magic, version, flags, bitboard, size, seed, four_prob, score,
+# elapsed seconds, moves, free cells, bitboard state
+HEADER = struct.Struct('<4sBBBHQdQdIIQ')
+# The move count at which the generator state after it was saved.
+CHECKPOINT = struct.Struct('<I')
+# Python's Mersenne Twister state: 624 words and a position.
+RNG_WORDS = 625
+# Saving the 2.5 KB generator state costs more than a move, so it is only
+# saved every this many moves; restore() replays the draws since.
+RNG_CHECKPOINT = 256
+# Moves past this many are still played and saved on the board, but the
+# move log, and with it the replay of the game, stops there.
+MAX_MOVES = 1 << 22
+
+
+class Session:
+    # The current game, kept in a memory-mapped file with a fixed layout:
+    # header, a generator checkpoint, the exponent of every cell, the
+    # free-cell order of indexed boards (uint16 per cell) and the moves,
+    # four per byte as in replays.
+    # A move rewrites the header and the cells in place; the OS writes the
+    # pages back, so a crash of the game loses nothing.
+    def __init__(self, path, mm, fields):
+        (_, _, self.flags, self.bitboard, self.size, self.seed, self.four_prob, self.score,
+         self.elapsed, self.moves, self.free_count, self.bits) = fields
+        self.path = path
+        self.mm = mm
+        cells = self.size * self.size
+        self.rng_at = HEADER.size
+        self.cells_at = self.rng_at + CHECKPOINT.size + 4 * RNG_WORDS
+        self.free_at = self.cells_at + cells
+        self.moves_at = self.free_at + 2 * cells
+
+    @classmethod
+    def create(cls, board, path=SESSION_FILE):
+        cells = board.size * board.size
+        with open(path, 'w+b') as f:
+            f.truncate(HEADER.size + CHECKPOINT.size + 4 * RNG_WORDS + 3 * cells + MAX_MOVES // 4)
+            mm = mmap.mmap(f.fileno(), 0)
+        session = cls(path, mm, (MAGIC, VERSION, 0, 0, board.size, board.seed, board.four_prob,
+                                 0, 0.0, 0, 0, 0))
+        session.save_board(board)
+        session.save_rng(board)
+        session.write_header()
+        return session
+
+    @classmethod
+    def open(cls, path=SESSION_FILE):
+        # The unfinished session in path, or None.
+        try:
+            with open(path, 'r+b') as f:
+                mm = mmap.mmap(f.fileno(), 0)
+        except (OSError, ValueError):
+            return None
+        if len(mm) < HEADER.size:
+            mm.close()
+            return None
+        fields = HEADER.unpack_from(mm, 0)
+        if fields[0] != MAGIC or fields[1] != VERSION or fields[2] & FINISHED:
+            mm.close()
+            return None
+        return cls(path, mm, fields)
+
+    def write_header(self):
+        HEADER.pack_into(self.mm, 0, MAGIC, VERSION, self.flags, self.bitboard, self.size, self.seed,
+                         self.four_prob, self.score, self.elapsed, self.moves, self.free_count, self.bits)
+
+    def save_board(self, board):
+        state = board.state()
+        self.score = board.score
+        if isinstance(state, int):
+            self.bitboard = 1
+            self.bits = state
+            return
+        self.bitboard = 0
+        self.mm[self.cells_at:self.cells_at + len(state)] = state
+        if board.size <= MAX_INDEXED_SIZE:
+            free = array('H', board.empty_cells())
+            self.mm[self.free_at:self.free_at + 2 * len(free)] = free.tobytes()
+            self.free_count = len(free)
+
+    def save_rng(self, board):
+        # Only random() is ever drawn from a board's generator, so the
+        # state's gauss_next is always None and is not kept.
+        state = array('I', board.rng.getstate()[1])
+        start = self.rng_at + CHECKPOINT.size
+        CHECKPOINT.pack_into(self.mm, self.rng_at, self.moves)
+        self.mm[start:start + 4 * RNG_WORDS] = state.tobytes()
+
+    def update(self, board, key):
+        # Called after a move and its spawn.
+        if self.moves < MAX_MOVES:
+            self.mm[self.moves_at + self.moves // 4] |= KEYS.index(key) << 2 * (self.moves % 4)
+        self.moves += 1
+        self.save_board(board)
+        if self.moves % RNG_CHECKPOINT == 0:
+            self.save_rng(board)
+        self.write_header()
+
+    def rewind(self, board):
+        # Called after an undo or redo. The board is saved, but the game
+        # can no longer be rebuilt from the move log.
+        self.flags |= UNDONE
+        self.save_board(board)
+        self.write_header()
+
+    def tick(self, elapsed):
+        self.elapsed = elapsed
+        self.write_header()
+
+    def finish(self):
+        self.flags |= FINISHED
+        self.write_header()
+        self.close()
+
+    def close(self):
+        if not self.mm.closed:
+            self.mm.flush()
+            self.mm.close()
+
+    def restore(self):
+        n = self.size
+        if self.bitboard:
+            exponents = np.array([(self.bits >> (4 * k)) & 15 for k in range(n * n)], dtype=np.uint8)
+        else:
+            exponents = np.frombuffer(self.mm[self.cells_at:self.cells_at + n * n], dtype=np.uint8)
+        free = None
+        if self.free_count:
+            free = array('H')
+            free.frombytes(self.mm[self.free_at:self.free_at + 2 * self.free_count])
+        board = Board.from_exponents(exponents.reshape(n, n), self.score, self.seed, self.four_prob, free)
+        # Bring the generator to where the game left it: the last
+        # checkpoint, then two draws for the tile after every move since.
+        (saved,) = CHECKPOINT.unpack_from(self.mm, self.rng_at)
+        start = self.rng_at + CHECKPOINT.size
+        state = array('I')
+        state.frombytes(self.mm[start:start + 4 * RNG_WORDS])
+        board.rng.setstate((3, tuple(state), None))
+        draw = board.rng.random
+        for _ in range(2 * (self.moves - saved)):
+            draw()
+        return board
+
+    def recorder(self, board):
+        # The recorder for the rest of the game, or None if an undo made
+        # the moves so far unreplayable.
+        if self.flags & UNDONE:
+            return None
+        recorder = replay.Recorder(board)
+        count = min(self.moves, MAX_MOVES)
+        recorder.codes = bytearray(replay.unpack_moves(self.mm[self.moves_at:self.moves_at + -(-count // 4)], count))
+        return recorder
@@ -0,0 +1,243 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import numpy as np
+import engine
+from engine import KEYS, POW, Board
+
+
+class LegacyBoard:
+    # The per-cell implementation the front ends used before engine.py, as
+    # the benchmark baseline. add_random_tile, compress, merge and
+    # check_game_status are verbatim from Game2048 in 2048_qt.py; move()
+    # runs the same loops but takes a key letter instead of a Qt key event
+    # and has no mutex.
+    def __init__(self, grid):
+        self.grid_size = len(grid)
+        self.grid = np.array(grid, dtype=int)
+        self.score = 0
+        self.num_count = 0
+
+    def copy(self):
+        return LegacyBoard(self.grid)
+
+    def add_random_tile(self):
+        x, y = random.randint(0, self.grid_size - 1), random.randint(0, self.grid_size - 1)
+        while self.grid[x][y] != 0:
+            x, y = random.randint(0, self.grid_size - 1), random.randint(0, self.grid_size - 1)
+        self.grid[x][y] = 2
+
+    def compress(self, row_or_col, direction):
+        temp = np.zeros(self.grid_size, dtype=int)
+        index = 0 if direction == 0 else self.grid_size - 1
+        for i in range(self.grid_size):
+            if row_or_col[i] != 0:
+                temp[index] = row_or_col[i]
+                index = index + 1 if direction == 0 else index - 1
+        return temp
+
+    def merge(self, row_or_col, direction):
+        temp = self.compress(row_or_col, direction)
+        for i in range(self.grid_size - 1):
+            if temp[i] == temp[i + 1] and temp[i] != 0:
+                temp[i] *= 2
+                self.score += temp[i]
+                temp[i + 1] = 0
+                self.num_count -= 1
+        return self.compress(temp, direction)
+
+    def move(self, key):
+        moved = False
+        for i in range(self.grid_size):
+            if key == 'w' or key == 's':
+                new_col = self.merge(self.grid[:, i], 0 if key == 'w' else 1)
+                if not np.array_equal(self.grid[:, i], new_col):
+                    moved = True
+                self.grid[:, i] = new_col
+            else:
+                new_row = self.merge(self.grid[i, :], 0 if key == 'a' else 1)
+                if not np.array_equal(self.grid[i, :], new_row):
+                    moved = True
+                self.grid[i, :] = new_row
+        return moved
+
+    def check_game_status(self):
+        if np.any(self.grid == 0):
+            return True
+        for i in range(self.grid_size):
+            for j in range(self.grid_size - 1):
+                if self.grid[i][j] == self.grid[i][j + 1] or self.grid[j][i] == self.grid[j + 1][i]:
+                    return True
+        return False
+
+
+def legacy_ops(samples):
+    boards = [LegacyBoard(POW[e]) for e in samples]
+    rows = [b.grid[0].copy() for b in boards]
+
+    def cycle(b):
+        for key in KEYS:
+            if b.move(key):
+                b.add_random_tile()
+                b.check_game_status()
+                return
+
+    def spawn(b):
+        if np.any(b.grid == 0):
+            b.add_random_tile()
+
+    return {
+        'compress': (rows, lambda r, b=boards[0]: b.compress(r, 0)),
+        'merge': (rows, lambda r, b=boards[0]: b.merge(r, 0)),
+        'move': (boards, lambda b: b.copy().move('w')),
+        'check': (boards, lambda b: b.check_game_status()),
+        'spawn': (boards, lambda b: spawn(b.copy())),
+        'cycle': (boards, lambda b: cycle(b.copy())),
+        'copy': (boards, lambda b: b.copy()),
+    }
+
+
+def engine_ops(samples):
+    boards = [Board.from_exponents(e, seed=k) for k, e in enumerate(samples)]
+    rows = [bytes(e[0]) for e in samples]
+    # compress_rows works on a stack of rows; these are stacks of one, so
+    # its time is mostly NumPy call overhead. Single moves never call it:
+    # they compress inside slide_row (the merge op) or the row tables.
+    row_arrays = [e[:1] for e in samples]
+
+    def cycle(b):
+        for key in KEYS:
+            if b.move(key)[0]:
+                b.spawn()
+                b.check()
+                return
+
+    return {
+        'compress': (row_arrays, engine.compress_rows),
+        'merge': (rows, engine.slide_row),
+        'move': (boards, lambda b: b.copy().move('w')),
+        'check': (boards, lambda b: b.check()),
+        'spawn': (boards, lambda b: b.copy().spawn()),
+        'cycle': (boards, lambda b: cycle(b.copy())),
+        'copy': (boards, lambda b: b.copy()),
+    }
+
+
+BACKENDS = {'legacy': legacy_ops, 'engine': engine_ops}
+
+
+def make_samples(size, count, rng):
+    # Mid-game looking boards: about half the samples full, the rest 40% empty.
+    samples = []
+    for k in range(count):
+        e = rng.integers(1, min(size * size, 11) + 1, size=(size, size)).astype(np.uint8)
+        if k % 2:
+            e[rng.random((size, size)) < 0.4] = 0
+        samples.append(e)
+    return samples
+
+
+def time_op(items, func, repeat, min_time):
+    best = float('inf')
+    for _ in range(repeat):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            for item in items:
+                func(item)
+            calls += len(items)
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        best = min(best, elapsed / calls)
+    return best * 1e9
+
+
+def run(sizes, backends, ops, samples, repeat, min_time, seed):
+    results = []
+    for size in sizes:
+        rng = np.random.default_rng(seed + size)
+        sample_boards = make_samples(size, samples, rng)
+        for backend in backends:
+            for op, (items, func) in BACKENDS[backend](sample_boards).items():
+                if ops and op not in ops:
+                    continue
+                random.seed(seed)
+                ns = time_op(items, func, repeat, min_time)
+                results.append({'backend': backend, 'op': op, 'size': size, 'ns': ns})
+                print(f'{backend:<8} {op:<9} N={size:<3} {ns / 1000:12.2f} us', flush=True)
+    return {
+        'meta': {
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'seed': seed,
+            'samples': samples,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def compare(base, new, threshold):
+    index = {(r['backend'], r['op'], r['size']): r['ns'] for r in base['results']}
+    regressions = 0
+    for r in new['results']:
+        key = (r['backend'], r['op'], r['size'])
+        if key not in index:
+            continue
+        ratio = r['ns'] / index[key]
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = 'REGRESSION'
+            regressions += 1
+        elif ratio < 1 - threshold:
+            flag = 'faster'
+        print(f'{key[0]:<8} {key[1]:<9} N={key[2]:<3} {index[key] / 1000:10.2f} -> {r["ns"] / 1000:10.2f} us '
+              f'{ratio:6.2f}x {flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the 2048 hot paths.")
+    sub = parser.add_subparsers(dest='command')
+
+    run_parser = sub.add_parser('run', help="time the hot paths and write JSON")
+    run_parser.add_argument('-o', '--output', help="write results to this JSON file")
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=list(range(3, 21)))
+    run_parser.add_argument('--backends', nargs='+', choices=sorted(BACKENDS), default=['legacy', 'engine'])
+    run_parser.add_argument('--ops', nargs='+', default=None)
+    run_parser.add_argument('--samples', type=int, default=32)
+    run_parser.add_argument('--repeat', type=int, default=3)
+    run_parser.add_argument('--min-time', type=float, default=0.05, help="seconds per repeat")
+    run_parser.add_argument('--seed', type=int, default=0)
+
+    cmp_parser = sub.add_parser('compare', help="compare two result files")
+    cmp_parser.add_argument('base')
+    cmp_parser.add_argument('new')
+    cmp_parser.add_argument('-t', '--threshold', type=float, default=0.10, help="allowed slowdown, 0.10 = 10%%")
+
+    args = parser.parse_args()
+    if args.command == 'compare':
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        regressions = compare(base, new, args.threshold)
+        print(f'{regressions} regression(s) beyond {args.threshold:.0%}')
+        sys.exit(1 if regressions else 0)
+
+    if args.command is None:
+        args = run_parser.parse_args([])
+    report = run(args.sizes, args.backends, args.ops, args.samples, args.repeat, args.min_time, args.seed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import argparse
+import time
+import numpy as np
+from engine import KEYS, move_batch
+
+
+def random_boards(count, size, rng):
+    boards = rng.integers(1, 7, size=(count, size, size)).astype(np.uint8)
+    boards[rng.random(boards.shape) < 0.4] = 0
+    return boards
+
+
+def bench(count, size, repeat, seed):
+    rng = np.random.default_rng(seed)
+    boards = random_boards(count, size, rng)
+    move_batch(boards[:1], 'a')
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for key in KEYS:
+            move_batch(boards, key)
+        best = min(best, time.perf_counter() - start)
+    return len(KEYS) * count / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the batched 2048 move kernel.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[3, 4, 5, 8, 20])
+    parser.add_argument('--boards', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        count = max(args.boards * 16 // (size * size), 1)
+        rate = bench(count, size, args.repeat, args.seed)
+        print(f'N={size:<3} boards={count:<8} {rate / 1e6:8.3f} M board-moves/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Each probe runs a front end unchanged, but quits as soon as its first
+# window (or the terminal size prompt) is up.
+PROBES = {
+    'qt': '''
+import runpy, sys
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QTimer
+exec_ = QApplication.exec_
+def quick_exec(app):
+    QTimer.singleShot(0, app.quit)
+    return exec_()
+QApplication.exec_ = quick_exec
+sys.argv = ['2048_qt.py']
+runpy.run_path('2048_qt.py', run_name='__main__')
+''',
+    'tk': '''
+import runpy, tkinter
+mainloop = tkinter.Tk.mainloop
+def quick_mainloop(root, n=0):
+    root.after(0, root.destroy)
+    mainloop(root, n)
+tkinter.Tk.mainloop = quick_mainloop
+runpy.run_path('2048_window.py', run_name='__main__')
+''',
+    'terminal': '''
+import builtins, runpy, sys
+def first_prompt(prompt=''):
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    raise SystemExit
+builtins.input = first_prompt
+runpy.run_path('2048.py', run_name='__main__')
+''',
+}
+
+
+def time_startup(frontend, repeat):
+    # Wall time from process launch to exit, interpreter start included.
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-c', PROBES[frontend]], cwd=HERE,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        elapsed = time.perf_counter() - start
+        if proc.returncode:
+            return None, proc.stderr.decode(errors='replace').strip().splitlines()[-1:]
+        times.append(elapsed * 1000)
+    return times, None
+
+
+def import_times(frontend, top):
+    # The slowest imports by cumulative time, as reported by -X importtime.
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBES[frontend]], cwd=HERE,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    # -X importtime indents the name by two spaces per level of nesting.
+    # Only depth 0 is kept: the imports run by the probe and the front
+    # end's own module code, whose times include their children.
+    rows = []
+    for line in proc.stderr.decode(errors='replace').splitlines():
+        m = re.match(r'import time:\s+\d+ \|\s+(\d+) \|( +)(\S+)', line)
+        if m and len(m.group(2)) == 1:
+            rows.append((int(m.group(1)) / 1000, m.group(3)))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def run(frontends, repeat, top):
+    results = []
+    for frontend in frontends:
+        times, error = time_startup(frontend, repeat)
+        if times is None:
+            print(f'{frontend:<9} failed: {" ".join(error)}')
+            continue
+        result = {'frontend': frontend, 'min_ms': min(times), 'median_ms': statistics.median(times)}
+        results.append(result)
+        print(f'{frontend:<9} first window {result["median_ms"]:8.1f} ms median, {result["min_ms"]:8.1f} ms min')
+        for ms, name in import_times(frontend, top) if top else ():
+            print(f'    {ms:8.1f} ms  {name}')
+    return {'python': sys.version.split()[0], 'repeat': repeat, 'results': results}
+
+
+def compare(base, new, target):
+    index = {r['frontend']: r['median_ms'] for r in base['results']}
+    missed = 0
+    for r in new['results']:
+        if r['frontend'] not in index:
+            continue
+        ratio = r['median_ms'] / index[r['frontend']]
+        ok = ratio <= target
+        missed += not ok
+        print(f'{r["frontend"]:<9} {index[r["frontend"]]:8.1f} -> {r["median_ms"]:8.1f} ms {ratio:6.2f}x '
+              f'{"ok" if ok else "MISSED"}')
+    return missed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure time to the first window of each 2048 front end.")
+    parser.add_argument('--frontends', nargs='+', choices=sorted(PROBES), default=['terminal', 'tk', 'qt'])
+    parser.add_argument('-r', '--repeat', type=int, default=10)
+    parser.add_argument('--imports', type=int, default=0, metavar='N', help="also list the N slowest imports")
+    parser.add_argument('-o', '--output', help="write results to this JSON file")
+    parser.add_argument('--baseline', help="compare against an earlier JSON result")
+    parser.add_argument('--target', type=float, default=0.5, help="required new/baseline ratio, 0.5 = twice as fast")
+    args = parser.parse_args()
+
+    report = run(args.frontends, args.repeat, args.imports)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            base = json.load(f)
+        sys.exit(1 if compare(base, report, args.target) else 0)
+
+
+if __name__ == '__main__':
+    main()
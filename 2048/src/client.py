@@ -0,0 +1,90 @@
+import random
+import socket
+from engine import FOUR_PROB, KEYS
+
+
+def parse_address(text):
+    # "HOST:PORT" or ":PORT" is TCP; anything else is a Unix socket path.
+    host, sep, port = text.rpartition(':')
+    if sep and port.isdigit():
+        return (host or '127.0.0.1', int(port))
+    return text
+
+
+def connect(address):
+    if isinstance(address, tuple):
+        sock = socket.create_connection(address)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(address)
+    return sock
+
+
+class RemoteBoard:
+    # Board stand-in for a game hosted by server.py, with the parts of the
+    # Board interface the front ends use. The server places the new tile
+    # as part of every move, so spawn() has nothing left to do.
+    def __init__(self, address, size, seed=None):
+        if isinstance(address, str):
+            address = parse_address(address)
+        self.sock = connect(address)
+        self.file = self.sock.makefile('rwb')
+        self.size = size
+        if seed is None:
+            seed = random.randrange(1 << 63)
+        self.seed = seed
+        self.four_prob = FOUR_PROB
+        try:
+            self.request(f'new {size} {seed}')
+        except ValueError:
+            # The server refused the game, e.g. a size it does not host.
+            self.file.close()
+            self.sock.close()
+            raise
+
+    def request(self, line):
+        self.file.write(line.encode() + b'\n')
+        self.file.flush()
+        reply = self.file.readline().decode().split()
+        if not reply:
+            raise ConnectionError("the game server closed the connection")
+        if reply[0] != 'ok':
+            raise ValueError(' '.join(reply[1:]))
+        moved, gain, merges, self.legal, self.score = map(int, reply[1:6])
+        self.cells = bytes.fromhex(reply[6])
+        return bool(moved), gain, merges
+
+    def move(self, key):
+        if key not in KEYS:
+            return False, 0, 0
+        return self.request(f'move {key}')
+
+    def spawn(self):
+        return None
+
+    def legal_moves(self):
+        return self.legal
+
+    def check(self):
+        return self.legal != 0
+
+    def state(self):
+        return self.cells
+
+    def tile_rows(self):
+        n = self.size
+        return [[1 << e if e else 0 for e in self.cells[i * n:i * n + n]] for i in range(n)]
+
+    def max_tile(self):
+        e = max(self.cells)
+        return 1 << e if e else 0
+
+    def close(self):
+        try:
+            self.file.write(b'quit\n')
+            self.file.flush()
+        except OSError:
+            pass
+        self.file.close()
+        self.sock.close()
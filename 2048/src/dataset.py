@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from engine import KEYS, Board, keys_from_mask
+from selfplay import load_policy, policy_rng
+
+# A dataset is a directory of .npy shards holding one structured array
+# each, plus index.json listing the shards in order. A row is one move:
+# the board before it, the move (its index in KEYS), the score it gained,
+# the board after the new tile and whether the game ended there. Boards
+# are cell exponents, row by row.
+INDEX_FILE = 'index.json'
+SHARD_ROWS = 1 << 16
+# Rows are gathered this many at a time before going into the shard.
+BLOCK_ROWS = 4096
+
+
+def record_dtype(size):
+    return np.dtype([('board', np.uint8, (size, size)), ('action', np.uint8), ('reward', np.int32),
+                     ('next_board', np.uint8, (size, size)), ('done', np.bool_)])
+
+
+def trajectory(size, policy, seed, max_moves=None):
+    # Yields (state, action, reward, next_state, done) for every move of
+    # one game, with board.state() encodings (see encode_states).
+    rng = policy_rng(seed)
+    board = Board(size, seed)
+    board.spawn()
+    board.spawn()
+    moves = 0
+    legal = keys_from_mask(board.legal_moves())
+    while legal and (max_moves is None or moves < max_moves):
+        key = policy(board, legal, rng)
+        before = board.state()
+        moved, gain, _ = board.move(key)
+        if not moved:
+            raise ValueError(f"policy chose an illegal move {key!r}")
+        board.spawn()
+        moves += 1
+        legal = keys_from_mask(board.legal_moves())
+        yield before, KEYS.index(key), gain, board.state(), not legal
+
+
+def encode_states(states, size):
+    # board.state() values to a (len, size, size) exponent array. States
+    # are bitboard ints or cell bytes; only 4x4 games that reached the
+    # 32768 tile mix both.
+    out = np.empty((len(states), size * size), dtype=np.uint8)
+    ints = [k for k, s in enumerate(states) if isinstance(s, int)]
+    if ints:
+        bits = np.array([states[k] for k in ints], dtype=np.uint64)
+        out[ints] = (bits[:, None] >> (4 * np.arange(size * size, dtype=np.uint64))) & np.uint64(15)
+    if len(ints) < len(states):
+        rest = [k for k, s in enumerate(states) if not isinstance(s, int)]
+        out[rest] = np.frombuffer(b''.join(states[k] for k in rest), dtype=np.uint8).reshape(len(rest), -1)
+    return out.reshape(len(states), size, size)
+
+
+class ShardWriter:
+    # Streams rows into memory-mapped shards of shard_rows rows; only the
+    # current block of rows is held in memory.
+    def __init__(self, path, size, prefix='shard', shard_rows=SHARD_ROWS):
+        self.path = path
+        self.size = size
+        self.prefix = prefix
+        self.shard_rows = shard_rows
+        self.dtype = record_dtype(size)
+        self.shards = []
+        self.shard = None
+        self.filled = 0
+        self.block = []
+        os.makedirs(path, exist_ok=True)
+
+    def add(self, row):
+        self.block.append(row)
+        if len(self.block) >= BLOCK_ROWS:
+            self.flush()
+
+    def extend(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def flush(self):
+        block, self.block = self.block, []
+        while block:
+            if self.shard is None:
+                name = f'{self.prefix}-{len(self.shards):05d}.npy'
+                self.shard = np.lib.format.open_memmap(os.path.join(self.path, name), mode='w+',
+                                                       dtype=self.dtype, shape=(self.shard_rows,))
+                self.shards.append([name, 0])
+                self.filled = 0
+            part, block = block[:self.shard_rows - self.filled], block[self.shard_rows - self.filled:]
+            before, actions, rewards, after, done = zip(*part)
+            rows = self.shard[self.filled:self.filled + len(part)]
+            rows['board'] = encode_states(before, self.size)
+            rows['action'] = actions
+            rows['reward'] = rewards
+            rows['next_board'] = encode_states(after, self.size)
+            rows['done'] = done
+            self.filled += len(part)
+            self.shards[-1][1] = self.filled
+            if self.filled == self.shard_rows:
+                self.close_shard()
+
+    def close_shard(self):
+        shard, self.shard = self.shard, None
+        shard.flush()
+        name = self.shards[-1][0]
+        if self.filled < len(shard):
+            # The last shard is cut down to the rows it holds.
+            full = os.path.join(self.path, name)
+            part = np.lib.format.open_memmap(full + '.part', mode='w+', dtype=self.dtype, shape=(self.filled,))
+            part[:] = shard[:self.filled]
+            part.flush()
+            del part, shard
+            os.replace(full + '.part', full)
+
+    def close(self):
+        self.flush()
+        if self.shard is not None:
+            self.close_shard()
+        return self.shards
+
+
+def write_games(path, size, policy_name, seeds, max_moves, prefix, shard_rows):
+    policy = load_policy(policy_name)
+    writer = ShardWriter(path, size, prefix, shard_rows)
+    for seed in seeds:
+        writer.extend(trajectory(size, policy, seed, max_moves))
+    return writer.close()
+
+
+def write_dataset(path, size, games, policy='random', workers=None, seed=0, max_moves=None, shard_rows=SHARD_ROWS):
+    # Every worker plays its share of the games into shards of its own;
+    # index.json then lists them all.
+    load_policy(policy)
+    workers = workers or os.cpu_count() or 1
+    seeds = list(range(seed, seed + games))
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(write_games, path, size, policy, seeds[w::workers], max_moves, f'w{w:03d}', shard_rows)
+                   for w in range(min(workers, games))]
+        shards = [shard for future in futures for shard in future.result()]
+    index = {'size': size, 'games': games, 'policy': policy, 'seed': seed,
+             'rows': sum(rows for _, rows in shards), 'shards': shards}
+    with open(os.path.join(path, INDEX_FILE), 'w') as f:
+        json.dump(index, f, indent=2)
+    index['seconds'] = time.perf_counter() - start
+    return index
+
+
+def open_shards(path):
+    # The shards of a dataset as read-only memory maps, in index order.
+    with open(os.path.join(path, INDEX_FILE)) as f:
+        index = json.load(f)
+    return [np.load(os.path.join(path, name), mmap_mode='r') for name, _ in index['shards']]
+
+
+def iter_batches(path, batch_size=BLOCK_ROWS):
+    # Structured batches of up to batch_size rows; each is a view into a
+    # shard's memory map, so nothing is copied until a field is used.
+    for shard in open_shards(path):
+        for start in range(0, len(shard), batch_size):
+            yield shard[start:start + batch_size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write or inspect 2048 self-play datasets.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    write_parser = sub.add_parser('write', help="play games and write their moves as .npy shards")
+    write_parser.add_argument('path')
+    write_parser.add_argument('-n', '--size', type=int, default=4)
+    write_parser.add_argument('-g', '--games', type=int, default=1000)
+    write_parser.add_argument('-p', '--policy', default='random', help="random, greedy or module:function")
+    write_parser.add_argument('-w', '--workers', type=int, default=None)
+    write_parser.add_argument('--seed', type=int, default=0)
+    write_parser.add_argument('--max-moves', type=int, default=None)
+    write_parser.add_argument('--shard-rows', type=int, default=SHARD_ROWS)
+    info_parser = sub.add_parser('info', help="summarize a dataset")
+    info_parser.add_argument('path')
+    args = parser.parse_args()
+
+    if args.command == 'write':
+        if not 3 <= args.size <= 20:
+            parser.error("size must be between 3 and 20")
+        index = write_dataset(args.path, args.size, args.games, args.policy, args.workers, args.seed,
+                              args.max_moves, args.shard_rows)
+        print(f"{index['rows']} moves of {index['games']} games in {len(index['shards'])} shards, "
+              f"{index['seconds']:.2f} s ({index['rows'] / index['seconds']:.0f} moves/s)")
+        return
+
+    rows = games = reward = 0
+    actions = np.zeros(len(KEYS), dtype=np.int64)
+    for batch in iter_batches(args.path):
+        rows += len(batch)
+        games += int(batch['done'].sum())
+        reward += int(batch['reward'].sum(dtype=np.int64))
+        actions += np.bincount(batch['action'], minlength=len(KEYS))
+    print(f"{rows} moves, {games} finished games, mean reward {reward / max(rows, 1):.2f}")
+    print('moves: ' + '  '.join(f'{key} {100 * count / max(rows, 1):.1f}%' for key, count in zip(KEYS, actions)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,665 @@
+import random
+from lazy import lazy_import
+
+# NumPy is only needed for huge boards and batch work; a game on a small
+# board never loads it.
+np = lazy_import('numpy')
+
+KEYS = ('w', 'a', 's', 'd')
+MAX_BITBOARD_SIZE = 4
+# Boards up to this size keep a free-cell index and slide row by row in
+# Python; larger (huge) boards slide the whole grid at once with NumPy.
+MAX_INDEXED_SIZE = 20
+MAX_SIZE = 1024
+
+# Probability that spawn() places a 4 instead of a 2.
+FOUR_PROB = 0.1
+
+# Kinds of tile motion, see Board.motions().
+SLIDE, MERGE, SPAWN = 0, 1, 2
+
+_pow = None
+
+# Set in the packed row info when a merge would need a 5th exponent bit.
+_OVERFLOW = 1 << 60
+_BOARD_MASK = (1 << 64) - 1
+
+_tables = {}
+_row_slices = {}
+_row_cache = {}
+_ROW_CACHE_LIMIT = 1 << 16
+
+
+def tile_values():
+    # Tile values for exponents as a NumPy array; exponent 0 is an empty cell.
+    global _pow
+    if _pow is None:
+        _pow = np.array([0] + [1 << e for e in range(1, 63)], dtype=np.int64)
+    return _pow
+
+
+def __getattr__(name):
+    if name == 'POW':
+        return tile_values()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _transpose4(x):
+    a1 = x & 0xF0F00F0FF0F00F0F
+    a2 = x & 0x0000F0F00000F0F0
+    a3 = x & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+def compress_rows(rows):
+    if rows.shape[1] >= 16:
+        # Long rows: a stable sort on "is empty" keeps tile order and is
+        # cheaper than scattering through nonzero().
+        return np.take_along_axis(rows, np.argsort(rows == 0, axis=1, kind='stable'), axis=1)
+    out = np.zeros_like(rows)
+    nz = rows != 0
+    r, c = np.nonzero(nz)
+    pos = np.cumsum(nz, axis=1) - 1
+    out[r, pos[r, c]] = rows[r, c]
+    return out
+
+
+def slide_rows(rows):
+    # rows is an (R, N) array of exponents; every row slides to the left.
+    tmp = compress_rows(rows)
+    left, right = tmp[:, :-1], tmp[:, 1:]
+    eq = (left == right) & (left != 0)
+    # A run of equal tiles merges pairwise from the front: 2 2 2 2 -> 4 4.
+    idx = np.arange(eq.shape[1])
+    last_break = np.maximum.accumulate(np.where(eq, -1, idx), axis=1)
+    merged = eq & ((idx - last_break) % 2 == 1)
+    # Only the merged positions are touched, which matters on huge boards.
+    r, c = np.nonzero(merged)
+    left[r, c] += 1
+    right[r, c] = 0
+    gains = np.bincount(r, weights=tile_values()[left[r, c]], minlength=len(tmp)).astype(np.int64)
+    merges = np.bincount(r, minlength=len(tmp))
+    return compress_rows(tmp), gains, merges
+
+
+def slide_row(row):
+    tiles = [e for e in row if e]
+    out = []
+    gain = merges = 0
+    i = 0
+    while i < len(tiles):
+        if i + 1 < len(tiles) and tiles[i] == tiles[i + 1]:
+            e = tiles[i] + 1
+            out.append(e)
+            gain += 1 << e
+            merges += 1
+            i += 2
+        else:
+            out.append(tiles[i])
+            i += 1
+    return bytes(out + [0] * (len(row) - len(out))), gain, merges
+
+
+def row_motions(row):
+    # (from, to, merged) for every tile of a row sliding left, as positions
+    # in the row; both tiles of a merge end on the same cell.
+    out = []
+    to = 0
+    waiting = None
+    for j, e in enumerate(row):
+        if not e:
+            continue
+        if waiting is not None and row[waiting] == e:
+            out.append((waiting, to, True))
+            out.append((j, to, True))
+            to += 1
+            waiting = None
+        else:
+            if waiting is not None:
+                out.append((waiting, to, False))
+                to += 1
+            waiting = j
+    if waiting is not None:
+        out.append((waiting, to, False))
+    return out
+
+
+def _cache_row(row):
+    if len(_row_cache) >= _ROW_CACHE_LIMIT:
+        _row_cache.clear()
+    hit = _row_cache[row] = slide_row(row)
+    return hit
+
+
+def get_row_slices(n, key):
+    slices = _row_slices.get((n, key))
+    if slices is None:
+        if key == 'a':
+            slices = [slice(i * n, i * n + n) for i in range(n)]
+        elif key == 'd':
+            slices = [slice(i * n + n - 1, i * n - 1 if i else None, -1) for i in range(n)]
+        elif key == 'w':
+            slices = [slice(j, None, n) for j in range(n)]
+        else:
+            slices = [slice(n * (n - 1) + j, None, -n) for j in range(n)]
+        _row_slices[(n, key)] = slices
+    return slices
+
+
+class _Tables:
+    # Row tables for bitboards, indexed by the packed row. Games only ever
+    # see a small part of the 16**n rows, so rows are computed as they turn
+    # up instead of all at once: a missing row reads as None, using it
+    # raises TypeError, and the caller adds the rows of its board with
+    # add_board() and tries once more. The lookups stay plain list indexing.
+    def __init__(self, n):
+        self.n = n
+        self.row_bits = 4 * n
+        self.row_mask = (1 << self.row_bits) - 1
+        self.row_shifts = [r * self.row_bits for r in range(n)]
+        self.col_shifts = [4 * j for j in range(n)]
+        count = 16 ** n
+        # moves[key][p][row] is the result of sliding row as the p-th row
+        # (for 'a'/'d') or transposed column (for 'w'/'s'), already shifted
+        # into place, plus its info << 64. A move is the sum of one lookup
+        # per row: the board in the low 64 bits and the summed info above.
+        self.moves = {key: [[None] * count for _ in range(n)] for key in KEYS}
+        self.spread = [None] * count
+        self.empties = [None] * count
+        # Bit 0: the row can slide left, bit 1: it can slide right.
+        self.row_moves = [None] * count
+        self._batch = None
+        self.transpose = _transpose4 if n == 4 else self._transpose
+
+    def add_board(self, b):
+        # Fills in every row and column of bitboard b.
+        n = self.n
+        m = self.row_mask
+        for i, shift in enumerate(self.row_shifts):
+            self.add_row((b >> shift) & m)
+            self.add_row(sum(((b >> (4 * (k * n + i))) & 15) << (4 * k) for k in range(n)))
+
+    def add_row(self, row):
+        if self.row_moves[row] is not None:
+            return
+        n = self.n
+        cells = bytes((row >> (4 * j)) & 15 for j in range(n))
+        left, left_gain, left_merges = slide_row(cells)
+        right, right_gain, right_merges = slide_row(cells[::-1])
+        right = right[::-1]
+
+        def pack(r):
+            return sum(e << (4 * j) for j, e in enumerate(r))
+
+        def spread(r):
+            # Nibble j of a row becomes cell (j, 0) of a board.
+            return sum(e << (self.row_bits * j) for j, e in enumerate(r))
+
+        def info(res, gain, merges):
+            packed = (gain << 8) | merges
+            return packed | _OVERFLOW if max(res) > 15 else packed
+
+        left_info = info(left, left_gain, left_merges) << 64
+        right_info = info(right, right_gain, right_merges) << 64
+        moves = self.moves
+        for p, (shift, col) in enumerate(zip(self.row_shifts, self.col_shifts)):
+            moves['a'][p][row] = (pack(left) << shift) | left_info
+            moves['d'][p][row] = (pack(right) << shift) | right_info
+            moves['w'][p][row] = (spread(left) << col) | left_info
+            moves['s'][p][row] = (spread(right) << col) | right_info
+        self.spread[row] = spread(cells)
+        self.empties[row] = tuple(j for j in range(n) if not cells[j])
+        # row_moves goes last: a search thread may be reading the tables,
+        # and a row counts as present once row_moves is set.
+        self.row_moves[row] = (left != cells) | (right != cells) << 1
+
+    def batch_rows(self):
+        # Left slides of every row as NumPy arrays (rows, gains, merges),
+        # for sliding whole stacks of boards; built on first use.
+        if self._batch is None:
+            nibbles = np.arange(self.n, dtype=np.int64)
+            idx = np.arange(16 ** self.n, dtype=np.int64)
+            self._batch = slide_rows(((idx[:, None] >> (4 * nibbles)) & 15).astype(np.uint8))
+        return self._batch
+
+    def _transpose(self, b):
+        spread = self.spread
+        m = self.row_mask
+        tr = 0
+        for shift, col in zip(self.row_shifts, self.col_shifts):
+            tr |= spread[(b >> shift) & m] << col
+        return tr
+
+
+def get_tables(n):
+    tables = _tables.get(n)
+    if tables is None:
+        tables = _tables[n] = _Tables(n)
+    return tables
+
+
+def _oriented(boards, key):
+    if key == 'a':
+        return boards
+    if key == 'd':
+        return boards[:, :, ::-1]
+    if key == 'w':
+        return boards.transpose(0, 2, 1)
+    return boards.transpose(0, 2, 1)[:, :, ::-1]
+
+
+def move_batch(boards, key):
+    # boards is a (B, N, N) stack of exponents. Returns the moved boards,
+    # per-board score gains, a moved mask and per-board merge counts.
+    boards = np.asarray(boards, dtype=np.uint8)
+    count, n = boards.shape[0], boards.shape[1]
+    rows = _oriented(boards, key).reshape(-1, n)
+    if n <= MAX_BITBOARD_SIZE and (rows < 16).all():
+        left_rows, left_gain, left_merges = get_tables(n).batch_rows()
+        idx = (rows.astype(np.int64) << (4 * np.arange(n))).sum(axis=1)
+        res, gains, merges = left_rows[idx], left_gain[idx], left_merges[idx]
+    else:
+        res, gains, merges = slide_rows(rows)
+    out = np.empty_like(boards)
+    _oriented(out, key)[...] = res.reshape(count, n, n)
+    moved = (out != boards).reshape(count, -1).any(axis=1)
+    return out, gains.reshape(count, n).sum(axis=1), moved, merges.reshape(count, n).sum(axis=1)
+
+
+def legal_moves_batch(boards):
+    # Bit i of each mask is set when KEYS[i] would change that board. A
+    # line can slide towards its start if a tile follows a gap there, and
+    # towards its end if a tile precedes a gap; equal neighbours allow both.
+    boards = np.asarray(boards, dtype=np.uint8)
+    mask = np.zeros(boards.shape[0], dtype=np.uint8)
+    pairs = ((boards[:, :-1, :], boards[:, 1:, :], 0, 2), (boards[:, :, :-1], boards[:, :, 1:], 1, 3))
+    for a, b, start_bit, end_bit in pairs:
+        a_empty = a == 0
+        b_empty = b == 0
+        merge = (a == b) & ~a_empty
+        mask |= ((a_empty & ~b_empty) | merge).any(axis=(1, 2)).astype(np.uint8) << start_bit
+        mask |= ((b_empty & ~a_empty) | merge).any(axis=(1, 2)).astype(np.uint8) << end_bit
+    return mask
+
+
+def spawn_batch(cells, r_cell, r_four, four_prob):
+    # cells is a (B, N*N) array of exponents with an empty cell in every
+    # row; r_cell and r_four are the two draws of Board.spawn per board.
+    empty = cells == 0
+    target = (r_cell * empty.sum(axis=1)).astype(np.int64)
+    k = (empty.cumsum(axis=1) > target[:, None]).argmax(axis=1)
+    cells[np.arange(len(cells)), k] = np.where(r_four < four_prob, 2, 1)
+
+
+def legal_moves(board):
+    if isinstance(board, Board):
+        return board.legal_moves()
+    return int(legal_moves_batch(np.asarray(board)[None])[0])
+
+
+def keys_from_mask(mask):
+    return [key for bit, key in enumerate(KEYS) if mask >> bit & 1]
+
+
+class Board:
+    def __init__(self, size, seed=None, four_prob=FOUR_PROB):
+        self.size = size
+        self.score = 0
+        # Always keep a concrete seed so any game can be replayed later.
+        if seed is None:
+            seed = random.randrange(1 << 63)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.four_prob = four_prob
+        self._bits = None
+        self._cells = None
+        self._free = None
+        if size <= MAX_BITBOARD_SIZE:
+            self._tables = get_tables(size)
+            self._bits = 0
+        else:
+            self._cells = bytearray(size * size)
+            self._index_free()
+
+    def _index_free(self, order=None):
+        if self.size > MAX_INDEXED_SIZE:
+            self._free = None
+            return
+        # Large boards keep their empty cells in a list with a cell -> slot
+        # map, so cells can be added and removed in O(1) by swap-remove.
+        # The list order decides where spawn() puts a tile, so a restored
+        # board passes the order it was saved with.
+        if order is None:
+            self._free = [k for k, e in enumerate(self._cells) if not e]
+        else:
+            self._free = list(order)
+        self._slot = [-1] * (self.size * self.size)
+        for i, k in enumerate(self._free):
+            self._slot[k] = i
+
+    def _fill(self, k):
+        free, slot = self._free, self._slot
+        i = slot[k]
+        last = free.pop()
+        if last != k:
+            free[i] = last
+            slot[last] = i
+        slot[k] = -1
+
+    def _empty(self, k):
+        self._slot[k] = len(self._free)
+        self._free.append(k)
+
+    def spawn_tiles(self):
+        if not self.four_prob:
+            return ((1, 1.0),)
+        return ((1, 1.0 - self.four_prob), (2, self.four_prob))
+
+    @classmethod
+    def from_exponents(cls, exponents, score=0, seed=None, four_prob=FOUR_PROB, free=None):
+        exponents = np.asarray(exponents, dtype=np.uint8)
+        board = cls(exponents.shape[0], seed, four_prob)
+        board.score = score
+        if board._bits is not None and exponents.max() < 16:
+            board._bits = sum(int(e) << (4 * k) for k, e in enumerate(exponents.flat))
+        else:
+            board._cells = bytearray(exponents.tobytes())
+            board._bits = None
+            board._index_free(free)
+        return board
+
+    def copy(self):
+        other = Board.__new__(Board)
+        other.__dict__.update(self.__dict__)
+        if self._cells is not None:
+            other._cells = bytearray(self._cells)
+            if self._free is not None:
+                other._free = self._free[:]
+                other._slot = self._slot[:]
+        return other
+
+    def max_tile(self):
+        if self._cells is not None:
+            e = max(self._cells)
+        else:
+            b = self._bits
+            e = max((b >> (4 * k)) & 15 for k in range(self.size * self.size))
+        return 1 << e if e else 0
+
+    def exponents(self):
+        if self._cells is not None:
+            return np.frombuffer(bytes(self._cells), dtype=np.uint8).reshape(self.size, self.size)
+        n = self.size
+        b = self._bits
+        return np.array([[(b >> (4 * (i * n + j))) & 15 for j in range(n)] for i in range(n)], dtype=np.uint8)
+
+    def grid(self):
+        return tile_values()[self.exponents()]
+
+    def tile_rows(self):
+        # Tile values as lists of rows, without going through NumPy.
+        n = self.size
+        if self._cells is not None:
+            cells = self._cells
+        else:
+            b = self._bits
+            cells = [(b >> (4 * k)) & 15 for k in range(n * n)]
+        return [[1 << e if e else 0 for e in cells[i * n:i * n + n]] for i in range(n)]
+
+    def _slide_bits(self, key):
+        # The summed table lookups for a move; 4x4 boards do this inline
+        # in move().
+        t = self._tables
+        b = self._bits if key == 'a' or key == 'd' else t.transpose(self._bits)
+        m = t.row_mask
+        x = 0
+        for shift, moves in zip(t.row_shifts, t.moves[key]):
+            x += moves[(b >> shift) & m]
+        return x
+
+    def _slide_grid(self, key):
+        cells = bytearray(self._cells)
+        n = self.size
+        view = _oriented(np.frombuffer(cells, dtype=np.uint8).reshape(1, n, n), key)[0]
+        res, gains, merges = slide_rows(view)
+        moved = bool((res != view).any())
+        view[...] = res
+        return cells, int(gains.sum()), int(merges.sum()), moved
+
+    def _slide_cells(self, key):
+        if self._free is None:
+            return self._slide_grid(key)
+        # Rows are memoized by their exponent bytes; most rows repeat.
+        cells = bytearray(self._cells)
+        cache = _row_cache
+        gain = merges = 0
+        changed = []
+        for sl in get_row_slices(self.size, key):
+            row = bytes(cells[sl])
+            hit = cache.get(row) or _cache_row(row)
+            if hit[0] != row:
+                cells[sl] = hit[0]
+                gain += hit[1]
+                merges += hit[2]
+                changed.append((sl, row, hit[0]))
+        return cells, gain, merges, changed
+
+    def _update_free(self, changed):
+        # Only rows that moved can change which cells are empty. A slid row
+        # holds its m tiles in front, so old gaps before m filled up and old
+        # tiles from m on left gaps behind. When most of the board shifted,
+        # one pass over the cells is cheaper than the per-cell updates.
+        n = self.size
+        if 8 * sum(new.count(0) for sl, old, new in changed) > n * n:
+            self._index_free()
+            return
+        free, slot = self._free, self._slot
+        for sl, old, new in changed:
+            cells = range(*sl.indices(n * n))
+            m = n - new.count(0)
+            j = old.find(0, 0, m)
+            while j != -1:
+                k = cells[j]
+                i = slot[k]
+                last = free.pop()
+                if last != k:
+                    free[i] = last
+                    slot[last] = i
+                slot[k] = -1
+                j = old.find(0, j + 1, m)
+            for j in range(m, n):
+                if old[j]:
+                    k = cells[j]
+                    slot[k] = len(free)
+                    free.append(k)
+
+    def _to_cells(self):
+        self._cells = bytearray(self.exponents().tobytes())
+        self._bits = None
+        self._index_free()
+
+    def move(self, key):
+        if key not in KEYS:
+            return False, 0, 0
+        b = self._bits
+        if b is not None:
+            t = self._tables
+            try:
+                if t.n == 4:
+                    p = t.moves[key]
+                    r = b if key == 'a' or key == 'd' else _transpose4(b)
+                    x = p[0][r & 0xFFFF] + p[1][(r >> 16) & 0xFFFF] + p[2][(r >> 32) & 0xFFFF] + p[3][r >> 48]
+                else:
+                    x = self._slide_bits(key)
+            except TypeError:
+                # A row not in the tables yet; once added, a second failure
+                # is a real error and is raised.
+                t.add_board(b)
+                x = self._slide_bits(key)
+            info = x >> 64
+            if info < _OVERFLOW:
+                new = x & _BOARD_MASK
+                if new == b:
+                    return False, 0, 0
+                self._bits = new
+                gain = info >> 8
+                self.score += gain
+                return True, gain, info & 255
+            self._to_cells()
+        cells, gain, merges, changed = self._slide_cells(key)
+        if not changed:
+            return False, 0, 0
+        self._cells = cells
+        if self._free is not None:
+            self._update_free(changed)
+        self.score += gain
+        return True, gain, merges
+
+    def motions(self, key):
+        # What move(key) will do to each tile, for animating it; call it
+        # before the move. Records are (src, dst, exponent, kind) with
+        # cells as (row, column), kind SLIDE or MERGE and the tile's
+        # exponent before the move. Tiles that stay put are left out. A
+        # front end adds (cell, cell, 0, SPAWN) for the tile spawn() places.
+        n = self.size
+        if self._cells is not None:
+            cells = self._cells
+        else:
+            b = self._bits
+            cells = [(b >> (4 * k)) & 15 for k in range(n * n)]
+        out = []
+        for sl in get_row_slices(n, key):
+            line = range(*sl.indices(n * n))
+            row = cells[sl]
+            for a, b, merged in row_motions(row):
+                if a != b or merged:
+                    out.append((divmod(line[a], n), divmod(line[b], n), row[a], MERGE if merged else SLIDE))
+        return out
+
+    def state(self):
+        if self._bits is not None:
+            return self._bits
+        return bytes(self._cells)
+
+    def set_state(self, state, score):
+        # Puts the board back to an earlier state() and score.
+        self.score = score
+        if isinstance(state, int):
+            self._bits = state
+            self._cells = None
+            self._free = None
+        else:
+            self._cells = bytearray(state)
+            self._bits = None
+            self._index_free()
+
+    def row_keys(self):
+        # Hashable keys for every row followed by every column.
+        if self._bits is not None:
+            t = self._tables
+            b = self._bits
+            m = t.row_mask
+            try:
+                tr = t.transpose(b)
+            except TypeError:
+                t.add_board(b)
+                tr = t.transpose(b)
+            return [(b >> shift) & m for shift in t.row_shifts] + [(tr >> shift) & m for shift in t.row_shifts]
+        cells = self._cells
+        return [bytes(cells[sl]) for sl in get_row_slices(self.size, 'a') + get_row_slices(self.size, 'w')]
+
+    def _empty_bits(self):
+        t = self._tables
+        b = self._bits
+        m = t.row_mask
+        n = self.size
+        return [i * n + j for i, shift in enumerate(t.row_shifts) for j in t.empties[(b >> shift) & m]]
+
+    def empty_cells(self):
+        if self._bits is not None:
+            try:
+                return self._empty_bits()
+            except TypeError:
+                self._tables.add_board(self._bits)
+                return self._empty_bits()
+        if self._free is None:
+            return np.flatnonzero(np.frombuffer(self._cells, dtype=np.uint8) == 0).tolist()
+        return self._free[:]
+
+    def place(self, k, exponent):
+        if self._bits is not None:
+            self._bits |= exponent << (4 * k)
+        else:
+            if not self._cells[k] and self._free is not None:
+                self._fill(k)
+            self._cells[k] = exponent
+
+    def spawn(self):
+        rng = self.rng
+        if self._bits is not None:
+            empty = self.empty_cells()
+        elif self._free is None:
+            empty = np.flatnonzero(np.frombuffer(self._cells, dtype=np.uint8) == 0)
+        else:
+            empty = self._free
+        if not len(empty):
+            return None
+        k = int(empty[int(rng.random() * len(empty))])
+        self.place(k, 2 if rng.random() < self.four_prob else 1)
+        return divmod(k, self.size)
+
+    def _legal_bits(self):
+        t = self._tables
+        b = self._bits
+        m = t.row_mask
+        row_moves = t.row_moves
+        horizontal = vertical = 0
+        tr = t.transpose(b)
+        for shift in t.row_shifts:
+            horizontal |= row_moves[(b >> shift) & m]
+            vertical |= row_moves[(tr >> shift) & m]
+        return (vertical & 1) | (horizontal & 1) << 1 | (vertical & 2) << 1 | (horizontal & 2) << 2
+
+    def legal_moves(self):
+        if self._bits is not None:
+            try:
+                return self._legal_bits()
+            except TypeError:
+                self._tables.add_board(self._bits)
+                return self._legal_bits()
+        if self._free is not None:
+            # A move is legal when it changes some row, and the memoized
+            # slides of the rows say so without any NumPy temporaries.
+            cells = self._cells
+            cache = _row_cache
+            mask = 0
+            for bit, key in enumerate(KEYS):
+                for sl in get_row_slices(self.size, key):
+                    row = bytes(cells[sl])
+                    if (cache.get(row) or _cache_row(row))[0] != row:
+                        mask |= 1 << bit
+                        break
+            return mask
+        e = np.frombuffer(self._cells, dtype=np.uint8).reshape(self.size, self.size)
+        mask = 0
+        for a, b, start_bit, end_bit in ((e[:-1], e[1:], 0, 2), (e[:, :-1], e[:, 1:], 1, 3)):
+            a_empty = a == 0
+            b_empty = b == 0
+            if ((a == b) & ~a_empty).any():
+                mask |= 1 << start_bit | 1 << end_bit
+                continue
+            if (a_empty > b_empty).any():
+                mask |= 1 << start_bit
+            if (b_empty > a_empty).any():
+                mask |= 1 << end_bit
+        return mask
+
+    def check(self):
+        # An empty cell always leaves a move.
+        if self._free:
+            return True
+        return self.legal_moves() != 0
@@ -0,0 +1,189 @@
+import argparse
+import time
+from collections import OrderedDict
+from engine import Board, keys_from_mask
+
+LOST_PENALTY = 200000.0
+EMPTY_WEIGHT = 270.0
+MERGES_WEIGHT = 700.0
+MONOTONICITY_WEIGHT = 47.0
+MONOTONICITY_POWER = 4.0
+SUM_WEIGHT = 11.0
+SUM_POWER = 3.5
+
+
+class _Timeout(Exception):
+    pass
+
+
+def row_heuristic(row):
+    empty = merges = counter = prev = 0
+    total = 0.0
+    for rank in row:
+        total += rank ** SUM_POWER
+        if rank == 0:
+            empty += 1
+        else:
+            if prev == rank:
+                counter += 1
+            elif counter > 0:
+                merges += 1 + counter
+                counter = 0
+            prev = rank
+    if counter > 0:
+        merges += 1 + counter
+
+    mono_left = mono_right = 0.0
+    for a, b in zip(row, row[1:]):
+        if a > b:
+            mono_left += a ** MONOTONICITY_POWER - b ** MONOTONICITY_POWER
+        else:
+            mono_right += b ** MONOTONICITY_POWER - a ** MONOTONICITY_POWER
+
+    return (LOST_PENALTY + EMPTY_WEIGHT * empty + MERGES_WEIGHT * merges
+            - MONOTONICITY_WEIGHT * min(mono_left, mono_right) - SUM_WEIGHT * total)
+
+
+class Expectimax:
+    def __init__(self, budget=0.005, max_depth=8, table_size=1 << 18, min_prob=1e-4):
+        self.budget = budget
+        self.max_depth = max_depth
+        self.table_size = table_size
+        self.min_prob = min_prob
+        self.table = OrderedDict()
+        self.rows = {}
+        self.last_depth = 0
+        # False when the last best_move ran out of time before depth 1 and
+        # fell back to the first legal move.
+        self.searched = True
+        self._deadline = None
+
+    def evaluate(self, board):
+        rows = self.rows
+        value = 0.0
+        for key in board.row_keys():
+            h = rows.get(key)
+            if h is None:
+                if isinstance(key, int):
+                    row = [(key >> (4 * j)) & 15 for j in range(board.size)]
+                else:
+                    row = list(key)
+                h = rows[key] = row_heuristic(row)
+            value += h
+        return value
+
+    def _lookup(self, state, depth):
+        hit = self.table.get(state)
+        if hit is not None and hit[0] >= depth:
+            self.table.move_to_end(state)
+            return hit[1]
+        return None
+
+    def _store(self, state, depth, value):
+        table = self.table
+        table[state] = (depth, value)
+        table.move_to_end(state)
+        if len(table) > self.table_size:
+            table.popitem(last=False)
+
+    def _max(self, board, depth, prob):
+        if time.perf_counter() > self._deadline:
+            raise _Timeout
+        state = board.state()
+        value = self._lookup(state, depth)
+        if value is not None:
+            return value
+        best = 0.0
+        for key in keys_from_mask(board.legal_moves()):
+            child = board.copy()
+            child.move(key)
+            best = max(best, self._chance(child, depth - 1, prob))
+        self._store(state, depth, best)
+        return best
+
+    def _chance(self, board, depth, prob):
+        empty = board.empty_cells()
+        if depth <= 0 or prob < self.min_prob or not empty:
+            return self.evaluate(board)
+        prob /= len(empty)
+        total = 0.0
+        for k in empty:
+            for exponent, p in board.spawn_tiles():
+                child = board.copy()
+                child.place(k, exponent)
+                total += p * self._max(child, depth, prob * p)
+        return total / len(empty)
+
+    def cancel(self):
+        # Called from another thread: the running search stops at its next
+        # node and returns what the finished depths found.
+        self._deadline = 0.0
+
+    def best_move(self, board):
+        children = []
+        for key in keys_from_mask(board.legal_moves()):
+            child = board.copy()
+            child.move(key)
+            children.append((key, child))
+        if not children:
+            return None
+        best = children[0][0]
+        self.last_depth = 0
+        self.searched = True
+        if len(children) == 1:
+            return best
+        self._deadline = time.perf_counter() + self.budget
+        for depth in range(1, self.max_depth + 1):
+            try:
+                values = [(self._chance(child, depth - 1, 1.0), key) for key, child in children]
+            except _Timeout:
+                break
+            best = max(values)[1]
+            self.last_depth = depth
+        self.searched = self.last_depth > 0
+        return best
+
+
+def play_game(size, solver, seed=None, verbose=False):
+    board = Board(size, seed)
+    board.spawn()
+    board.spawn()
+    moves = depths = 0
+    start = time.perf_counter()
+    while True:
+        key = solver.best_move(board)
+        if key is None:
+            break
+        board.move(key)
+        board.spawn()
+        moves += 1
+        depths += solver.last_depth
+        if verbose and moves % 100 == 0:
+            print(f'move {moves}: score {board.score}, max tile {board.max_tile()}')
+    elapsed = time.perf_counter() - start
+    return board, moves, elapsed, depths / max(moves, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play 2048 with an expectimax search.")
+    parser.add_argument('-n', '--size', type=int, default=4)
+    parser.add_argument('-g', '--games', type=int, default=1)
+    parser.add_argument('-b', '--budget', type=float, default=5.0, help="milliseconds per move")
+    parser.add_argument('-d', '--depth', type=int, default=8, help="maximum search depth")
+    parser.add_argument('--table-size', type=int, default=1 << 18)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+
+    solver = Expectimax(args.budget / 1000, args.depth, args.table_size)
+    for game in range(args.games):
+        seed = None if args.seed is None else args.seed + game
+        board, moves, elapsed, depth = play_game(args.size, solver, seed, args.verbose)
+        print(f'game {game + 1}: score {board.score}, max tile {board.max_tile()}, moves {moves}, '
+              f'{1000 * elapsed / max(moves, 1):.2f} ms/move, mean depth {depth:.1f}')
+        if args.verbose:
+            print(board.grid())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import sys
+import zlib
+from collections import deque
+
+# Default memory cap of a History, in bytes.
+HISTORY_LIMIT = 4 << 20
+# Rough cost of an entry beyond its payload: the tuple, the gain and the
+# deque slot.
+ENTRY_OVERHEAD = 120
+
+
+def state_delta(old, new):
+    # What turns state old into new and back again: the XOR of the two
+    # bitboards, or of the cell bytes (zlib packs the unchanged cells to
+    # almost nothing). A board that switched storage keeps both states.
+    if isinstance(old, int) and isinstance(new, int):
+        return old ^ new
+    if isinstance(old, int) or isinstance(new, int):
+        return (old, new)
+    xor = int.from_bytes(old, 'little') ^ int.from_bytes(new, 'little')
+    return zlib.compress(xor.to_bytes(len(old), 'little'), 1)
+
+
+def apply_delta(state, delta):
+    if isinstance(delta, int):
+        return state ^ delta
+    if isinstance(delta, tuple):
+        return delta[0] if state == delta[1] else delta[1]
+    xor = int.from_bytes(zlib.decompress(delta), 'little')
+    return (int.from_bytes(state, 'little') ^ xor).to_bytes(len(state), 'little')
+
+
+def entry_size(entry):
+    delta = entry[0]
+    if isinstance(delta, tuple):
+        return sum(sys.getsizeof(state) for state in delta) + ENTRY_OVERHEAD
+    return sys.getsizeof(delta) + ENTRY_OVERHEAD
+
+
+class History:
+    # Undo and redo stacks of one game. An entry is the delta between two
+    # consecutive states plus the score gain; the same entry undoes and
+    # redoes a move, so undo and redo just move it from one stack to the
+    # other. Past limit bytes the oldest undo entries are dropped.
+    def __init__(self, limit=HISTORY_LIMIT):
+        self.limit = limit
+        self.undos = deque()
+        self.redos = deque()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self.undos)
+
+    def push(self, before, score, board):
+        # Called after a move with the state() and score from before it.
+        entry = (state_delta(before, board.state()), board.score - score)
+        # A new move makes the undone ones unreachable.
+        for undone in self.redos:
+            self.nbytes -= entry_size(undone)
+        self.redos.clear()
+        self.undos.append(entry)
+        self.nbytes += entry_size(entry)
+        while self.nbytes > self.limit and self.undos:
+            self.nbytes -= entry_size(self.undos.popleft())
+
+    def undo(self, board):
+        if not self.undos:
+            return False
+        entry = self.undos.pop()
+        board.set_state(apply_delta(board.state(), entry[0]), board.score - entry[1])
+        self.redos.append(entry)
+        return True
+
+    def redo(self, board):
+        if not self.redos:
+            return False
+        entry = self.redos.pop()
+        board.set_state(apply_delta(board.state(), entry[0]), board.score + entry[1])
+        self.undos.append(entry)
+        return True
+
+    def clear(self):
+        self.undos.clear()
+        self.redos.clear()
+        self.nbytes = 0
@@ -0,0 +1,113 @@
+import json
+import math
+import platform
+import sys
+import time
+
+STAGES = ('input', 'move', 'spawn', 'save', 'check', 'render', 'paint')
+LATENCY_FILE = 'latency.json'
+# Percentiles cover the last WINDOW samples of a stage; the log-spaced
+# buckets (BUCKETS_PER_DECADE from 1 us to 10 s) count every sample.
+WINDOW = 1024
+BUCKETS_PER_DECADE = 10
+DECADES = 7
+
+
+def percentile(ordered, q):
+    # Linear interpolation between the closest ranks, as numpy.percentile.
+    pos = (len(ordered) - 1) * q / 100
+    i = int(pos)
+    if i + 1 >= len(ordered):
+        return ordered[-1]
+    return ordered[i] + (ordered[i + 1] - ordered[i]) * (pos - i)
+
+
+class Histogram:
+    def __init__(self):
+        self.samples = [0.0] * WINDOW
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (BUCKETS_PER_DECADE * DECADES + 1)
+
+    def add(self, seconds):
+        self.samples[self.count % WINDOW] = seconds
+        self.count += 1
+        self.total += seconds
+        k = int((math.log10(seconds) + 6) * BUCKETS_PER_DECADE) if seconds > 1e-6 else 0
+        self.buckets[min(k, len(self.buckets) - 1)] += 1
+
+    def summary(self):
+        recent = sorted(1000 * s for s in self.samples[:min(self.count, WINDOW)])
+        p50, p95, p99 = (percentile(recent, q) for q in (50, 95, 99))
+        return {'count': self.count, 'mean_ms': 1000 * self.total / self.count, 'p50_ms': p50,
+                'p95_ms': p95, 'p99_ms': p99, 'max_ms': recent[-1]}
+
+    def bucket_edges_ms(self):
+        return [1000 * 10 ** (k / BUCKETS_PER_DECADE - 6) for k in range(len(self.buckets))]
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.add(time.perf_counter() - self.start)
+
+
+class LatencyMonitor:
+    # Rolling per-stage timings of the move path of one front end:
+    #   with monitor.stage('move'):
+    #       board.move(key)
+    def __init__(self, frontend, size):
+        self.frontend = frontend
+        self.size = size
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self.timers = {stage: _Timer(h) for stage, h in self.histograms.items()}
+        self.visible = False
+        self.shown = False
+
+    def stage(self, name):
+        return self.timers[name]
+
+    def add(self, name, seconds):
+        self.histograms[name].add(seconds)
+
+    def toggle(self):
+        self.visible = not self.visible
+        self.shown = True
+        return self.visible
+
+    def summary(self):
+        return {stage: h.summary() for stage, h in self.histograms.items() if h.count}
+
+    def overlay_lines(self):
+        lines = [f'{"stage":<7}{"p50":>9}{"p95":>9}{"p99":>9}  ms']
+        for stage, s in self.summary().items():
+            lines.append(f'{stage:<7}{s["p50_ms"]:9.3f}{s["p95_ms"]:9.3f}{s["p99_ms"]:9.3f}')
+        return lines
+
+    def report(self):
+        return {
+            'frontend': self.frontend,
+            'size': self.size,
+            'window': WINDOW,
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'stages': self.summary(),
+            'histograms': {stage: {'edges_ms': h.bucket_edges_ms(), 'counts': h.buckets}
+                           for stage, h in self.histograms.items() if h.count},
+        }
+
+    def export(self, path=LATENCY_FILE):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def export_if_shown(self, path=LATENCY_FILE):
+        # Sessions that never opened the overlay leave no file behind.
+        if self.shown:
+            self.export(path)
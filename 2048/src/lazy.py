@@ -0,0 +1,18 @@
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    # The module object for name, executed only on first attribute access
+    # (importlib's LazyLoader recipe). Modules already loaded come back as
+    # they are.
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,183 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from client import parse_address
+from engine import keys_from_mask
+from latency import percentile
+from server import raise_file_limit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+async def open_session(address, size, seed):
+    if isinstance(address, tuple):
+        reader, writer = await asyncio.open_connection(*address)
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    else:
+        reader, writer = await asyncio.open_unix_connection(address)
+    writer.write(f'new {size} {seed}\n'.encode())
+    await writer.drain()
+    return reader, writer, (await reader.readline()).split()
+
+
+async def play(address, size, seed, clock, latencies):
+    # One player: a random legal move, wait for the reply, repeat; a lost
+    # game starts over.
+    rng = random.Random(seed)
+    reader, writer, reply = await open_session(address, size, seed)
+    clock.connected += 1
+    if clock.connected == clock.sessions:
+        clock.all_connected.set()
+    await clock.started.wait()
+    moves = 0
+    while time.perf_counter() < clock.deadline:
+        legal = keys_from_mask(int(reply[4]))
+        line = f'move {rng.choice(legal)}\n' if legal else f'new {size} {rng.randrange(1 << 63)}\n'
+        start = time.perf_counter()
+        writer.write(line.encode())
+        await writer.drain()
+        reply = (await reader.readline()).split()
+        if not reply or reply[0] != b'ok':
+            raise ConnectionError(f"bad reply {reply!r}")
+        if legal:
+            latencies.append(time.perf_counter() - start)
+            moves += 1
+    writer.write(b'quit\n')
+    writer.close()
+    return moves
+
+
+class Clock:
+    # Holds every player until all sessions are connected, then runs them
+    # for the same stretch of time.
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.connected = 0
+        self.all_connected = asyncio.Event()
+        self.started = asyncio.Event()
+        self.deadline = float('inf')
+
+
+async def run_players(address, size, sessions, duration, seed):
+    clock = Clock(sessions)
+    latencies = []
+    tasks = [asyncio.ensure_future(play(address, size, seed + i, clock, latencies)) for i in range(sessions)]
+    # A player that fails to connect ends the wait too; gather raises it.
+    await asyncio.wait(tasks + [asyncio.ensure_future(clock.all_connected.wait())],
+                       return_when=asyncio.FIRST_COMPLETED)
+    clock.deadline = time.perf_counter() + duration
+    clock.started.set()
+    moves = await asyncio.gather(*tasks)
+    return sum(moves), latencies
+
+
+def client_worker(address, size, sessions, duration, seed):
+    raise_file_limit()
+    return asyncio.run(run_players(address, size, sessions, duration, seed))
+
+
+def run_level(address, size, sessions, duration, workers, seed):
+    shares = [sessions // workers + (i < sessions % workers) for i in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(client_worker, address, size, share, duration, seed + 1000003 * i)
+                   for i, share in enumerate(shares) if share]
+        results = [f.result() for f in futures]
+    latencies = sorted(ms * 1000 for _, lat in results for ms in lat)
+    moves = sum(m for m, _ in results)
+    if not latencies:
+        return {'sessions': sessions, 'moves': 0, 'moves_per_s': 0.0}
+    return {
+        'sessions': sessions,
+        'moves': moves,
+        'moves_per_s': moves / duration,
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': latencies[-1],
+    }
+
+
+def server_stats(address):
+    with socket.socket(socket.AF_UNIX if isinstance(address, str) else socket.AF_INET) as sock:
+        sock.connect(address)
+        sock.sendall(b'stats\n')
+        _, _, moves, ticks = sock.makefile('rb').readline().split()
+        sock.sendall(b'quit\n')
+    return int(moves), int(ticks)
+
+
+def start_server(tick_ms):
+    # A server of our own on a fresh socket, in its own process.
+    if hasattr(socket, 'AF_UNIX'):
+        address = os.path.join(tempfile.mkdtemp(), 'server.sock')
+        args = ['--unix', address]
+    else:
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        address = ('127.0.0.1', port)
+        args = ['--port', str(port)]
+    proc = subprocess.Popen([sys.executable, os.path.join(HERE, 'server.py'), '--tick-ms', str(tick_ms)] + args,
+                            stdout=subprocess.PIPE)
+    proc.stdout.readline()
+    return proc, address
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the 2048 game server.")
+    parser.add_argument('--server', metavar='ADDRESS', help="HOST:PORT or Unix socket path; default: start one")
+    parser.add_argument('-n', '--size', type=int, default=4)
+    parser.add_argument('-s', '--sessions', type=int, nargs='+', default=[100, 250, 500, 1000, 2000, 4000],
+                        help="concurrent sessions for each step of the ramp")
+    parser.add_argument('-d', '--duration', type=float, default=5.0, help="seconds per step")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="client processes")
+    parser.add_argument('--p99-ms', type=float, default=50.0, help="latency target for a step to pass")
+    parser.add_argument('--tick-ms', type=float, default=0.0, help="batching delay of a server started here")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help="write results to this JSON file")
+    args = parser.parse_args()
+
+    proc = None
+    if args.server:
+        address = parse_address(args.server)
+    else:
+        proc, address = start_server(args.tick_ms)
+    workers = args.workers or max(1, (os.cpu_count() or 1) // 2)
+    levels = []
+    supported = 0
+    try:
+        print(f'{"sessions":>9} {"moves/s":>10} {"p50 ms":>8} {"p99 ms":>8} {"batch":>7}')
+        for sessions in args.sessions:
+            moves, ticks = server_stats(address)
+            level = run_level(address, args.size, sessions, args.duration, workers, args.seed)
+            moves2, ticks2 = server_stats(address)
+            level['moves_per_tick'] = (moves2 - moves) / max(1, ticks2 - ticks)
+            levels.append(level)
+            ok = level['moves'] and level['p99_ms'] <= args.p99_ms
+            print(f'{sessions:>9} {level["moves_per_s"]:>10.0f} {level.get("p50_ms", 0):>8.2f} '
+                  f'{level.get("p99_ms", 0):>8.2f} {level["moves_per_tick"]:>7.1f}{"" if ok else "  over target"}')
+            if not ok:
+                break
+            supported = sessions
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+    best = max((l for l in levels if l['sessions'] <= supported), key=lambda l: l['moves_per_s'], default=None)
+    print(f'supported: {supported} sessions at p99 <= {args.p99_ms:g} ms'
+          + (f', {best["moves_per_s"]:.0f} moves/s' if best else ''))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'size': args.size, 'p99_target_ms': args.p99_ms, 'workers': workers,
+                       'supported_sessions': supported, 'levels': levels}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+from collections import deque
+
+FRAME_MS = 16
+POLICIES = ('drop-newest', 'drop-oldest', 'collapse')
+
+
+class MoveQueue:
+    # Bounded buffer of pending moves. When full, 'drop-newest' ignores the
+    # new key and 'drop-oldest' discards the oldest queued one; 'collapse'
+    # also ignores a key equal to the last one still waiting.
+    def __init__(self, depth=8, policy='drop-newest'):
+        if policy not in POLICIES:
+            raise ValueError(f"unknown queue policy {policy!r}; use one of {', '.join(POLICIES)}")
+        self.depth = depth
+        self.policy = policy
+        self.keys = deque()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def push(self, key):
+        if self.policy == 'collapse' and self.keys and self.keys[-1] == key:
+            return False
+        if len(self.keys) >= self.depth:
+            if self.policy != 'drop-oldest':
+                return False
+            self.keys.popleft()
+        self.keys.append(key)
+        return True
+
+    def drain(self):
+        while self.keys:
+            yield self.keys.popleft()
+
+    def clear(self):
+        self.keys.clear()
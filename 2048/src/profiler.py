@@ -0,0 +1,156 @@
+import argparse
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Seconds between samples: a few per 16 ms frame.
+SAMPLE_INTERVAL = 0.005
+# While profiling, a thread waiting for the GIL gets it after this many
+# seconds. The sampler needs the GIL to read the stacks; with the default
+# 5 ms it mostly got it where PyQt releases the GIL around Qt calls, and
+# the samples piled up there instead of on the Python code running.
+SWITCH_INTERVAL = 0.0002
+PROFILE_PATTERN = 'profile-%Y%m%d-%H%M%S.txt'
+
+
+class SamplingProfiler:
+    # Samples the stack of every thread from a thread of its own and counts
+    # them as collapsed stacks ("thread;root;...;leaf count" lines), the
+    # input of flamegraph.pl and speedscope. Frames are file:function.
+    #
+    # start() is called from an event handler, so the frames under it are
+    # the ones running the event loop. A sample that finds that thread back
+    # in one of them gets a last frame [loop]: time spent in the toolkit
+    # itself, dispatching events, painting or waiting for input. Loops that
+    # wait in Python code name it in waits (file:function); a sample in one
+    # of those called straight from a loop frame counts as the loop too.
+    def __init__(self, loop='event loop', interval=SAMPLE_INTERVAL, waits=()):
+        self.loop = f'[{loop}]'
+        self.interval = interval
+        self.waits = set(waits)
+        self.stacks = Counter()
+        self.samples = 0
+        self.thread = None
+        self.stopping = threading.Event()
+
+    def running(self):
+        return self.thread is not None
+
+    def start(self):
+        self.stacks.clear()
+        self.samples = 0
+        # The frames are kept alive so their ids stay theirs.
+        self.base = []
+        frame = sys._getframe(1)
+        while frame is not None:
+            self.base.append(frame)
+            frame = frame.f_back
+        self.base_ids = {id(frame) for frame in self.base}
+        self.owner = threading.get_ident()
+        self.stopping.clear()
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(SWITCH_INTERVAL, self.switch_interval))
+        self.thread = threading.Thread(target=self.run, name='profiler', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        me = threading.get_ident()
+        names = {}
+
+        def name_of(frame):
+            code = frame.f_code
+            name = names.get(code)
+            if name is None:
+                name = names[code] = f'{os.path.basename(code.co_filename)}:{code.co_name}'
+            return name
+
+        while not self.stopping.wait(self.interval):
+            threads = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                if ident == self.owner:
+                    if id(frame) in self.base_ids or (
+                            id(frame.f_back) in self.base_ids and name_of(frame) in self.waits):
+                        stack.append(self.loop)
+                while frame is not None:
+                    stack.append(name_of(frame))
+                    frame = frame.f_back
+                stack.append(threads.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self, path=None):
+        # Writes the stacks to path, a new timestamped file by default, and
+        # returns the path.
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+        sys.setswitchinterval(self.switch_interval)
+        self.base = []
+        self.base_ids = set()
+        if path:
+            f = open(path, 'w')
+        else:
+            f, path = new_profile_file()
+        with f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f'{stack} {count}\n')
+        return path
+
+
+def new_profile_file():
+    # Profiles stopped within the same second get -1, -2, ... added to the
+    # name instead of overwriting each other.
+    stem, ext = os.path.splitext(time.strftime(PROFILE_PATTERN))
+    for n in itertools.count():
+        path = f'{stem}-{n}{ext}' if n else stem + ext
+        try:
+            return open(path, 'x'), path
+        except FileExistsError:
+            pass
+
+
+def read_stacks(path):
+    stacks = Counter()
+    with open(path) as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                stacks[stack] += int(count)
+    return stacks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a collapsed-stack profile written by the games.")
+    parser.add_argument('path')
+    parser.add_argument('-t', '--thread', default='MainThread', help="thread to summarize")
+    parser.add_argument('-n', '--top', type=int, default=15)
+    args = parser.parse_args()
+
+    own = Counter()
+    total = Counter()
+    samples = 0
+    for stack, count in read_stacks(args.path).items():
+        frames = stack.split(';')
+        if frames[0] != args.thread:
+            continue
+        samples += count
+        own[frames[-1]] += count
+        for frame in set(frames[1:]):
+            total[frame] += count
+    if not samples:
+        parser.error(f"no samples of thread {args.thread!r}")
+    print(f'{samples} samples of {args.thread}')
+    for title, counts in (('self', own), ('total', total)):
+        print(f'\n{title:>6}  function')
+        for frame, count in counts.most_common(args.top):
+            print(f'{100 * count / samples:5.1f}%  {frame}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+import math
+import time
+from engine import MERGE, SLIDE, SPAWN
+from lazy import lazy_import
+from move_queue import FRAME_MS
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtCore import Qt, QRect, QTimer
+from PyQt5.QtGui import QColor, QFont, QPainter, QPen, QPixmap, QRegion
+
+np = lazy_import('numpy')
+
+EMPTY_COLOR = "#d9d9d9"
+TILE_COLOR = "white"
+BORDER_WIDTH = 2
+FONT_SIZE = 20
+# Boards up to this size fit the window; larger ones scroll and zoom.
+MAX_FULL_SIZE = 20
+MIN_CELL, MAX_CELL = 8, 80
+# Past this many changed cells one full update is cheaper than per-cell ones.
+MAX_DIRTY_CELLS = 256
+# A move animates for ANIMATION_MS, one frame every FRAME_MS: tiles slide
+# for the first SLIDE_PART of it, then merged tiles pop and new ones grow.
+ANIMATION_MS = 100
+SLIDE_PART = 0.6
+POP_SCALE = 0.15
+
+_pixmaps = {}
+
+
+def tile_pixmap(exponent, cell_size):
+    # One pre-rendered pixmap per (value, cell size), shared by every board.
+    key = (exponent, cell_size)
+    pixmap = _pixmaps.get(key)
+    if pixmap is None:
+        pixmap = QPixmap(cell_size, cell_size)
+        pixmap.fill(QColor(TILE_COLOR if exponent else EMPTY_COLOR))
+        painter = QPainter(pixmap)
+        painter.setPen(QPen(Qt.black, BORDER_WIDTH))
+        painter.drawRect(BORDER_WIDTH // 2, BORDER_WIDTH // 2, cell_size - BORDER_WIDTH, cell_size - BORDER_WIDTH)
+        if exponent:
+            text = str(1 << exponent)
+            font = QFont()
+            font.setPixelSize(max(6, min(FONT_SIZE, int(cell_size * 1.6 / max(len(text), 2)))))
+            painter.setFont(font)
+            painter.drawText(pixmap.rect(), Qt.AlignCenter, text)
+        painter.end()
+        _pixmaps[key] = pixmap
+    return pixmap
+
+
+class BoardWidget(QWidget):
+    def __init__(self, size, cell_size, parent=None):
+        super().__init__(parent)
+        self.size = size
+        self.cell_size = cell_size
+        self.exponents = np.zeros((size, size), dtype=np.uint8)
+        self.latency = None
+        # Boards that scroll just snap to every new position.
+        self.animated = size <= MAX_FULL_SIZE
+        self.motions = None
+        self.hidden = set()
+        self.dirty = None
+        self.progress = 1.0
+        self.animation_start = 0.0
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setTimerType(Qt.PreciseTimer)
+        self.frame_timer.timeout.connect(self.next_frame)
+        self.setFixedSize(size * cell_size, size * cell_size)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+
+    def set_cell_size(self, cell_size):
+        cell_size = min(max(cell_size, MIN_CELL), MAX_CELL)
+        if cell_size != self.cell_size:
+            self.cell_size = cell_size
+            self.setFixedSize(self.size * cell_size, self.size * cell_size)
+            self.update()
+
+    def wheelEvent(self, event):
+        # Ctrl+wheel zooms; a plain wheel is left to the enclosing scroll area.
+        if event.modifiers() & Qt.ControlModifier:
+            factor = 1.25 if event.angleDelta().y() > 0 else 0.8
+            self.set_cell_size(int(self.cell_size * factor))
+            event.accept()
+        else:
+            event.ignore()
+
+    def cell_rect(self, i, j):
+        return QRect(j * self.cell_size, i * self.cell_size, self.cell_size, self.cell_size)
+
+    def set_board(self, exponents, motions=None):
+        # Schedule a repaint of the cells whose value changed; Qt merges the
+        # rectangles into one paint event. Inside a scroll area Qt clips the
+        # paint event to the viewport, so only visible cells are drawn.
+        # With motions (see Board.motions) the move is animated; a new board
+        # snaps the animation still running to its end.
+        if self.motions is not None:
+            self.stop_animation()
+        changed = np.argwhere(exponents != self.exponents)
+        self.exponents = exponents.copy()
+        if motions and self.animated:
+            self.start_animation(motions)
+        if len(changed) > MAX_DIRTY_CELLS:
+            self.update()
+            return
+        for i, j in changed.tolist():
+            self.update(self.cell_rect(i, j))
+
+    def start_animation(self, motions):
+        # The destination cells are drawn empty under the moving tiles, and
+        # every frame repaints the cells the tiles pass over.
+        self.motions = motions
+        self.hidden = {dst for _, dst, _, _ in motions}
+        if len(motions) > MAX_DIRTY_CELLS:
+            self.dirty = QRegion(self.rect())
+        else:
+            self.dirty = QRegion()
+            for src, dst, _, _ in motions:
+                self.dirty += self.cell_rect(*src).united(self.cell_rect(*dst))
+        self.progress = 0.0
+        self.animation_start = time.perf_counter()
+        self.frame_timer.start(FRAME_MS)
+
+    def stop_animation(self):
+        self.frame_timer.stop()
+        self.update(self.dirty)
+        self.motions = None
+        self.hidden = set()
+        self.dirty = None
+        self.progress = 1.0
+
+    def next_frame(self):
+        # Progress follows the clock, so a late frame skips ahead instead of
+        # stretching the animation.
+        self.progress = (time.perf_counter() - self.animation_start) * 1000 / ANIMATION_MS
+        if self.progress >= 1.0:
+            self.stop_animation()
+        else:
+            self.update(self.dirty)
+
+    def paint_motions(self, painter):
+        cell = self.cell_size
+        slide = min(self.progress / SLIDE_PART, 1.0)
+        pop = max(self.progress - SLIDE_PART, 0.0) / (1.0 - SLIDE_PART)
+        for (si, sj), (di, dj), e, kind in self.motions:
+            if kind == SLIDE or (kind == MERGE and slide < 1.0):
+                x = sj + (dj - sj) * slide
+                y = si + (di - si) * slide
+                painter.drawPixmap(int(x * cell), int(y * cell), tile_pixmap(e, cell))
+                continue
+            if kind == SPAWN and slide < 1.0:
+                continue
+            if kind == MERGE:
+                scale = 1.0 + POP_SCALE * math.sin(math.pi * pop)
+            else:
+                scale = max(pop, 0.1)
+            size = int(cell * scale)
+            offset = (cell - size) // 2
+            target = QRect(dj * cell + offset, di * cell + offset, size, size)
+            painter.drawPixmap(target, tile_pixmap(int(self.exponents[di, dj]), cell))
+
+    def paintEvent(self, event):
+        start = time.perf_counter()
+        rect = event.rect()
+        cell = self.cell_size
+        i0, i1 = rect.top() // cell, min(rect.bottom() // cell + 1, self.size)
+        j0, j1 = rect.left() // cell, min(rect.right() // cell + 1, self.size)
+        region = event.region()
+        hidden = self.hidden
+        painter = QPainter(self)
+        for i in range(i0, i1):
+            for j in range(j0, j1):
+                target = self.cell_rect(i, j)
+                if region.intersects(target):
+                    e = 0 if (i, j) in hidden else int(self.exponents[i, j])
+                    painter.drawPixmap(target.topLeft(), tile_pixmap(e, cell))
+        if self.motions is not None:
+            self.paint_motions(painter)
+        painter.end()
+        if self.latency is not None:
+            self.latency.add('paint', time.perf_counter() - start)
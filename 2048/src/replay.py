@@ -0,0 +1,275 @@
+import argparse
+import hashlib
+import os
+import random
+import struct
+import sys
+import time
+from lazy import lazy_import
+from engine import FOUR_PROB, KEYS, MAX_BITBOARD_SIZE, MAX_SIZE, Board, _oriented, get_tables, spawn_batch
+
+np = lazy_import('numpy')
+
+# A replay file is a sequence of records. Each record is a fixed header
+# followed by the moves, four per byte, two bits each, low bits first;
+# the 2-bit code of a move is its index in KEYS.
+MAGIC = b'2048'
+VERSION = 1
+HEADER = struct.Struct('<4sBHQdIQ8s')
+REPLAY_FILE = 'replays.2048r'
+CHUNK = 4096
+LONG_STREAM = 2000
+
+
+def board_digest(exponents):
+    return hashlib.blake2b(np.ascontiguousarray(exponents, dtype=np.uint8).tobytes(), digest_size=8).digest()
+
+
+def pack_moves(codes):
+    codes = np.asarray(codes, dtype=np.uint8)
+    padded = np.zeros(-(-len(codes) // 4) * 4, dtype=np.uint8)
+    padded[:len(codes)] = codes
+    quads = padded.reshape(-1, 4)
+    return (quads[:, 0] | quads[:, 1] << 2 | quads[:, 2] << 4 | quads[:, 3] << 6).tobytes()
+
+
+def unpack_moves(data, count):
+    packed = np.frombuffer(data, dtype=np.uint8)
+    return ((packed[:, None] >> np.array([0, 2, 4, 6], dtype=np.uint8)) & 3).reshape(-1)[:count]
+
+
+class Replay:
+    def __init__(self, size, seed, codes, score, digest, four_prob=FOUR_PROB):
+        self.size = size
+        self.seed = seed
+        self.codes = np.asarray(codes, dtype=np.uint8)
+        self.score = score
+        self.digest = digest
+        self.four_prob = four_prob
+
+    def keys(self):
+        return ''.join(KEYS[c] for c in self.codes.tolist())
+
+    def to_bytes(self):
+        header = HEADER.pack(MAGIC, VERSION, self.size, self.seed, self.four_prob,
+                             len(self.codes), self.score, self.digest)
+        return header + pack_moves(self.codes)
+
+
+class Recorder:
+    # Collects the moves of a game played on board; the board's seed and
+    # the moves are all that is needed to rebuild it.
+    def __init__(self, board):
+        self.board = board
+        self.codes = bytearray()
+
+    def add(self, key):
+        self.codes.append(KEYS.index(key))
+
+    def replay(self):
+        b = self.board
+        return Replay(b.size, b.seed, self.codes, b.score, board_digest(b.exponents()), b.four_prob)
+
+
+def record_spans(data):
+    # (start, end, ok) of every record in data, reading the headers only.
+    # A record for a board size the engine cannot play is not ok. A header
+    # that is cut short or not a replay header, or moves that run past the
+    # end of data, leave no way to find the next record, so the rest of
+    # data becomes one last record that is not ok.
+    spans = []
+    pos = 0
+    while pos < len(data):
+        if pos + HEADER.size > len(data):
+            spans.append((pos, len(data), False))
+            break
+        magic, version, size, _, _, moves, _, _ = HEADER.unpack_from(data, pos)
+        end = pos + HEADER.size + -(-moves // 4)
+        if magic != MAGIC or version != VERSION or end > len(data):
+            spans.append((pos, len(data), False))
+            break
+        spans.append((pos, end, 3 <= size <= MAX_SIZE))
+        pos = end
+    return spans
+
+
+def parse_replays(data):
+    # One Replay per record, None for a record that is not ok.
+    replays = []
+    for start, end, ok in record_spans(data):
+        if not ok:
+            replays.append(None)
+            continue
+        _, _, size, seed, four_prob, moves, score, digest = HEADER.unpack_from(data, start)
+        codes = unpack_moves(data[start + HEADER.size:end], moves)
+        replays.append(Replay(size, seed, codes, score, digest, four_prob))
+    return replays
+
+
+def read_replays(path):
+    with open(path, 'rb') as f:
+        return parse_replays(f.read())
+
+
+def write_replays(path, replays, append=False):
+    with open(path, 'ab' if append else 'wb') as f:
+        for replay in replays:
+            f.write(replay.to_bytes())
+
+
+def replay_board(replay):
+    # Replays the game one move at a time. Returns the board and whether
+    # every recorded move was legal.
+    board = Board(replay.size, replay.seed, replay.four_prob)
+    board.spawn()
+    board.spawn()
+    for code in replay.codes.tolist():
+        if not board.move(KEYS[code])[0]:
+            return board, False
+        board.spawn()
+    return board, True
+
+
+def verify(replay):
+    board, ok = replay_board(replay)
+    return ok and board.score == replay.score and board_digest(board.exponents()) == replay.digest
+
+
+def _random_streams(replays, length):
+    # Board.spawn draws two rng.random() values per tile: the cell, then
+    # 2 or 4. Drawing them up front lets all boards spawn in one step.
+    # Long streams come from NumPy's MT19937 started in the same state,
+    # which yields the same doubles as random.Random.
+    streams = np.zeros((len(replays), length))
+    rng = random.Random()
+    bits = np.random.MT19937()
+    legacy = np.random.RandomState(bits)
+    for i, replay in enumerate(replays):
+        rng.seed(replay.seed)
+        count = 4 + 2 * len(replay.codes)
+        if count > LONG_STREAM:
+            state = rng.getstate()[1]
+            bits.state = {'bit_generator': 'MT19937',
+                          'state': {'key': np.array(state[:624], dtype=np.uint32), 'pos': state[624]}}
+            streams[i, :count] = legacy.random_sample(count)
+        else:
+            draw = rng.random
+            streams[i, :count] = [draw() for _ in range(count)]
+    return streams
+
+
+def verify_batch(replays):
+    # Replays of up to 4x4 boards run in lockstep on a (B, N*N) exponent
+    # array through the bitboard row tables; anything else, and any board
+    # that reaches the 32768 tile, is replayed one board at a time.
+    results = [None] * len(replays)
+    by_size = {}
+    for i, replay in enumerate(replays):
+        if replay is None:
+            results[i] = False
+        elif replay.size <= MAX_BITBOARD_SIZE:
+            by_size.setdefault(replay.size, []).append(i)
+        else:
+            results[i] = verify(replay)
+    for n, index in by_size.items():
+        index.sort(key=lambda i: -len(replays[i].codes))
+        group = [replays[i] for i in index]
+        for i, ok in zip(index, _verify_group(n, group)):
+            results[i] = ok if ok is not None else verify(replays[i])
+    return results
+
+
+def _verify_group(n, replays):
+    left_rows, left_gain, _ = get_tables(n).batch_rows()
+    count = len(replays)
+    lengths = np.array([len(r.codes) for r in replays])
+    steps = int(lengths[0]) if count else 0
+    codes = np.zeros((count, steps), dtype=np.uint8)
+    for i, replay in enumerate(replays):
+        codes[i, :lengths[i]] = replay.codes
+    streams = _random_streams(replays, 4 + 2 * steps)
+    four_prob = np.array([r.four_prob for r in replays])
+    perms = np.stack([_oriented(np.arange(n * n).reshape(1, n, n), key).reshape(-1) for key in KEYS])
+    shifts = 4 * np.arange(n)
+
+    cells = np.zeros((count, n * n), dtype=np.uint8)
+    scores = np.zeros(count, dtype=np.int64)
+    legal = np.ones(count, dtype=bool)
+    fallback = np.zeros(count, dtype=bool)
+    spawn_batch(cells, streams[:, 0], streams[:, 1], four_prob)
+    spawn_batch(cells, streams[:, 2], streams[:, 3], four_prob)
+    for step in range(steps):
+        active = int(np.searchsorted(-lengths, -step, side='left'))
+        live = cells[:active]
+        # Exponent 15 can merge past what a nibble holds.
+        big = live.max(axis=1) >= 15
+        if big.any():
+            fallback[:active] |= big
+            live[big] = 0
+        perm = perms[codes[:active, step]]
+        rows = np.take_along_axis(live, perm, axis=1).reshape(active, n, n)
+        idx = (rows.astype(np.int64) << shifts).sum(axis=2)
+        out = np.empty_like(live)
+        np.put_along_axis(out, perm, left_rows[idx].reshape(active, n * n), axis=1)
+        moved = (out != live).any(axis=1)
+        legal[:active] &= moved | fallback[:active]
+        scores[:active] += left_gain[idx].sum(axis=1)
+        out_moved = out[moved]
+        spawn_batch(out_moved, streams[:active, 4 + 2 * step][moved], streams[:active, 5 + 2 * step][moved],
+                     four_prob[:active][moved])
+        out[moved] = out_moved
+        live[...] = out
+    results = []
+    for i, replay in enumerate(replays):
+        if fallback[i]:
+            results.append(None)
+        else:
+            results.append(bool(legal[i]) and int(scores[i]) == replay.score and
+                           board_digest(cells[i]) == replay.digest)
+    return results
+
+
+def verify_chunk(data):
+    return verify_batch(parse_replays(data))
+
+
+def verify_files(paths, workers=None):
+    chunks = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        spans = record_spans(data)
+        for i in range(0, len(spans), CHUNK):
+            part = spans[i:i + CHUNK]
+            chunks.append(data[part[0][0]:part[-1][1]])
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    if workers == 1:
+        results = [verify_chunk(c) for c in chunks]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(verify_chunk, chunks))
+    elapsed = time.perf_counter() - start
+    return [ok for chunk in results for ok in chunk], elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify 2048 replay files.")
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('-w', '--workers', type=int, default=None)
+    parser.add_argument('--show-failures', action='store_true', help="print the index of every failing replay")
+    args = parser.parse_args()
+
+    results, elapsed = verify_files(args.paths, args.workers)
+    failed = [i for i, ok in enumerate(results) if not ok]
+    print(f'{len(results)} replays in {elapsed:.2f} s ({len(results) / max(elapsed, 1e-9):.0f}/s), '
+          f'{len(failed)} failed')
+    if args.show_failures:
+        for i in failed:
+            print(f'  replay {i} failed')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+import argparse
+import importlib
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from engine import Board, keys_from_mask
+from replay import Recorder
+
+
+def random_policy(board, legal, rng):
+    return rng.choice(legal)
+
+
+def greedy_policy(board, legal, rng):
+    best, best_gain = [], -1
+    for key in legal:
+        gain = board.copy().move(key)[1]
+        if gain > best_gain:
+            best, best_gain = [key], gain
+        elif gain == best_gain:
+            best.append(key)
+    return rng.choice(best)
+
+
+POLICIES = {'random': random_policy, 'greedy': greedy_policy}
+
+
+def load_policy(name):
+    if name in POLICIES:
+        return POLICIES[name]
+    module, _, attr = name.partition(':')
+    if not attr:
+        raise ValueError(f"unknown policy {name!r}; use random, greedy or module:function")
+    return getattr(importlib.import_module(module), attr)
+
+
+def policy_rng(seed):
+    # The board draws its spawns from random.Random(seed); the policy gets
+    # a generator of its own, seeded from a string so its stream is
+    # unrelated to the board's.
+    return random.Random(f'policy:{seed}')
+
+
+def play_game(size, policy, seed, max_moves=None, replays=None):
+    rng = policy_rng(seed)
+    board = Board(size, seed)
+    recorder = Recorder(board)
+    board.spawn()
+    board.spawn()
+    moves = 0
+    while max_moves is None or moves < max_moves:
+        legal = keys_from_mask(board.legal_moves())
+        if not legal:
+            break
+        key = policy(board, legal, rng)
+        if not board.move(key)[0]:
+            raise ValueError(f"policy chose an illegal move {key!r}")
+        recorder.add(key)
+        board.spawn()
+        moves += 1
+    if replays is not None:
+        replays.append(recorder.replay().to_bytes())
+    return board.score, board.max_tile(), moves
+
+
+def play_chunk(size, policy_name, seeds, max_moves, record=False):
+    policy = load_policy(policy_name)
+    replays = [] if record else None
+    results = [play_game(size, policy, seed, max_moves, replays) for seed in seeds]
+    return results, b''.join(replays or ())
+
+
+def distribution(values):
+    values = np.asarray(values)
+    return {
+        'min': int(values.min()),
+        'mean': float(values.mean()),
+        'p50': float(np.percentile(values, 50)),
+        'p90': float(np.percentile(values, 90)),
+        'p99': float(np.percentile(values, 99)),
+        'max': int(values.max()),
+    }
+
+
+def run(size, games, policy='random', workers=None, seed=0, max_moves=None, record=None):
+    load_policy(policy)
+    workers = workers or os.cpu_count() or 1
+    seeds = list(range(seed, seed + games))
+    chunk = max(1, min(64, games // (workers * 4)))
+    chunks = [seeds[i:i + chunk] for i in range(0, games, chunk)]
+
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(play_chunk, size, policy, c, max_moves, record is not None) for c in chunks]
+        for future in futures:
+            chunk_results, data = future.result()
+            results.extend(chunk_results)
+            if record is not None:
+                record.write(data)
+    elapsed = time.perf_counter() - start
+
+    scores, tiles, lengths = zip(*results)
+    tile_counts = {}
+    for tile in tiles:
+        tile_counts[tile] = tile_counts.get(tile, 0) + 1
+    return {
+        'size': size,
+        'games': games,
+        'policy': policy,
+        'workers': workers,
+        'seconds': elapsed,
+        'games_per_s': games / elapsed,
+        'moves_per_s': sum(lengths) / elapsed,
+        'score': distribution(scores),
+        'length': distribution(lengths),
+        'max_tile': {str(k): tile_counts[k] for k in sorted(tile_counts)},
+    }
+
+
+def print_report(stats):
+    print(f"N={stats['size']}  games={stats['games']}  policy={stats['policy']}  workers={stats['workers']}")
+    print(f"{stats['seconds']:.2f} s  {stats['games_per_s']:.1f} games/s  {stats['moves_per_s']:.0f} moves/s")
+    for name in ('score', 'length'):
+        d = stats[name]
+        print(f"{name:<8} min {d['min']:<8} mean {d['mean']:<10.1f} p50 {d['p50']:<10.0f} "
+              f"p90 {d['p90']:<10.0f} p99 {d['p99']:<10.0f} max {d['max']}")
+    print('max tile')
+    for tile, count in stats['max_tile'].items():
+        print(f"  {tile:>8}: {count:<8} {100 * count / stats['games']:.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play 2048 games headlessly and report statistics.")
+    parser.add_argument('-n', '--size', type=int, default=4)
+    parser.add_argument('-g', '--games', type=int, default=1000)
+    parser.add_argument('-p', '--policy', default='random', help="random, greedy or module:function")
+    parser.add_argument('-w', '--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-moves', type=int, default=None)
+    parser.add_argument('--json', help="also write the statistics to this file")
+    parser.add_argument('--record', help="write a replay of every game to this file")
+    args = parser.parse_args()
+
+    if not 3 <= args.size <= 20:
+        parser.error("size must be between 3 and 20")
+    if args.record:
+        with open(args.record, 'wb') as record:
+            stats = run(args.size, args.games, args.policy, args.workers, args.seed, args.max_moves, record)
+    else:
+        stats = run(args.size, args.games, args.policy, args.workers, args.seed, args.max_moves)
+    print_report(stats)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(stats, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+import argparse
+import asyncio
+import os
+import random
+import numpy as np
+from engine import FOUR_PROB, KEYS, MAX_INDEXED_SIZE, legal_moves_batch, move_batch, spawn_batch
+
+# Line protocol, one session per connection:
+#   new SIZE [SEED]  start a game        -> ok MOVED GAIN MERGES LEGAL SCORE CELLS
+#   move KEY         move and spawn      -> ok ...
+#   get              current board       -> ok ...
+#   stats            server counters     -> stats SESSIONS MOVES TICKS
+#   quit
+# LEGAL is the legal-move mask of engine.legal_moves, CELLS the exponent
+# of every cell as hex bytes, row by row. Errors answer "err MESSAGE".
+DEFAULT_PORT = 2048
+MIN_SIZE = 3
+MAX_SERVER_SIZE = MAX_INDEXED_SIZE
+
+# SplitMix64 constants.
+GAMMA = np.uint64(0x9E3779B97F4A7C15)
+MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX2 = np.uint64(0x94D049BB133111EB)
+
+
+def spawn_draws(seeds, counts):
+    # The two draws of a spawn for every session, from SplitMix64 over its
+    # seed and the number of tiles it spawned so far. A session's tiles
+    # depend only on its seed, and no generator state is kept per session.
+    x = seeds[:, None] + (2 * counts[:, None] + np.arange(1, 3, dtype=np.uint64)) * GAMMA
+    x = (x ^ (x >> np.uint64(30))) * MIX1
+    x = (x ^ (x >> np.uint64(27))) * MIX2
+    x ^= x >> np.uint64(31)
+    return (x >> np.uint64(11)) * (1.0 / (1 << 53))
+
+
+class SessionStore:
+    # Every session with one board size, one row of each array per session
+    # (N*N + 26 bytes). Slots of closed sessions are reused.
+    def __init__(self, size, capacity=64):
+        self.size = size
+        self.cells = np.zeros((capacity, size, size), dtype=np.uint8)
+        self.scores = np.zeros(capacity, dtype=np.int64)
+        self.seeds = np.zeros(capacity, dtype=np.uint64)
+        self.spawns = np.zeros(capacity, dtype=np.uint64)
+        self.legal = np.zeros(capacity, dtype=np.uint8)
+        self.free = list(range(capacity - 1, -1, -1))
+        self.count = 0
+
+    def grow(self):
+        capacity = len(self.scores)
+        for name in ('cells', 'scores', 'seeds', 'spawns', 'legal'):
+            old = getattr(self, name)
+            new = np.zeros((2 * capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:capacity] = old
+            setattr(self, name, new)
+        self.free.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def open(self, seed):
+        if not self.free:
+            self.grow()
+        slot = self.free.pop()
+        self.cells[slot] = 0
+        self.scores[slot] = 0
+        self.seeds[slot] = seed
+        self.spawns[slot] = 0
+        slots = np.array([slot])
+        self.spawn(slots)
+        self.spawn(slots)
+        self.legal[slot] = legal_moves_batch(self.cells[slots])[0]
+        self.count += 1
+        return slot
+
+    def close(self, slot):
+        self.free.append(slot)
+        self.count -= 1
+
+    def spawn(self, slots):
+        draws = spawn_draws(self.seeds[slots], self.spawns[slots])
+        self.spawns[slots] += np.uint64(1)
+        cells = self.cells[slots].reshape(len(slots), -1)
+        spawn_batch(cells, draws[:, 0], draws[:, 1], FOUR_PROB)
+        self.cells[slots] = cells.reshape(-1, self.size, self.size)
+
+    def move(self, slots, codes):
+        # One move for each of slots (no slot twice), grouped by key so
+        # every key is one move_batch call. Returns moved, gains, merges.
+        moved = np.zeros(len(slots), dtype=bool)
+        gains = np.zeros(len(slots), dtype=np.int64)
+        merges = np.zeros(len(slots), dtype=np.int64)
+        for code, key in enumerate(KEYS):
+            sel = np.flatnonzero(codes == code)
+            if not len(sel):
+                continue
+            idx = slots[sel]
+            out, gains[sel], moved[sel], merges[sel] = move_batch(self.cells[idx], key)
+            self.cells[idx] = out
+        self.scores[slots] += gains
+        if moved.any():
+            self.spawn(slots[moved])
+        self.legal[slots] = legal_moves_batch(self.cells[slots])
+        return moved, gains, merges
+
+    def reply(self, slot, moved=False, gain=0, merges=0):
+        return (f'ok {int(moved)} {gain} {merges} {self.legal[slot]} {self.scores[slot]} '
+                f'{self.cells[slot].tobytes().hex()}\n').encode()
+
+
+class GameServer:
+    # Connections queue their moves; a tick takes everything queued since
+    # the last one and runs it through the engine store by store. Under
+    # load a tick carries the moves of many sessions.
+    def __init__(self, tick=0.0):
+        self.tick = tick
+        self.stores = {}
+        self.pending = []
+        self.wake = asyncio.Event()
+        self.moves = 0
+        self.ticks = 0
+
+    def store(self, size):
+        store = self.stores.get(size)
+        if store is None:
+            store = self.stores[size] = SessionStore(size)
+        return store
+
+    def sessions(self):
+        return sum(store.count for store in self.stores.values())
+
+    async def ticker(self):
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            # Let every connection with input ready queue its move first.
+            await asyncio.sleep(self.tick)
+            batch, self.pending = self.pending, []
+            self.step(batch)
+
+    def step(self, batch):
+        by_store = {}
+        for item in batch:
+            by_store.setdefault(item[0], []).append(item)
+        for store, items in by_store.items():
+            slots = np.array([item[1] for item in items])
+            codes = np.array([item[2] for item in items])
+            moved, gains, merges = store.move(slots, codes)
+            for item, m, g, c in zip(items, moved.tolist(), gains.tolist(), merges.tolist()):
+                if not item[3].done():
+                    item[3].set_result((m, g, c))
+        self.moves += len(batch)
+        self.ticks += 1
+
+    async def handle(self, reader, writer):
+        store = slot = None
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                words = line.decode(errors='replace').split()
+                if not words:
+                    continue
+                command, args = words[0], words[1:]
+                if command == 'move':
+                    if store is None:
+                        writer.write(b'err no game; send "new SIZE" first\n')
+                    elif len(args) != 1 or args[0] not in KEYS:
+                        writer.write(f'err move takes one of {" ".join(KEYS)}\n'.encode())
+                    else:
+                        done = loop.create_future()
+                        self.pending.append((store, slot, KEYS.index(args[0]), done))
+                        self.wake.set()
+                        writer.write(store.reply(slot, *await done))
+                elif command == 'new':
+                    try:
+                        size = int(args[0])
+                        seed = int(args[1]) if len(args) > 1 else random.randrange(1 << 63)
+                    except (IndexError, ValueError):
+                        writer.write(b'err usage: new SIZE [SEED]\n')
+                    else:
+                        if not MIN_SIZE <= size <= MAX_SERVER_SIZE:
+                            writer.write(f'err size must be between {MIN_SIZE} and {MAX_SERVER_SIZE}\n'.encode())
+                        elif not 0 <= seed < 1 << 64:
+                            writer.write(b'err seed must fit in 64 bits\n')
+                        else:
+                            if store is not None:
+                                store.close(slot)
+                            store = self.store(size)
+                            slot = store.open(seed)
+                            writer.write(store.reply(slot))
+                elif command == 'get':
+                    writer.write(store.reply(slot) if store is not None else b'err no game\n')
+                elif command == 'stats':
+                    writer.write(f'stats {self.sessions()} {self.moves} {self.ticks}\n'.encode())
+                elif command == 'quit':
+                    break
+                else:
+                    writer.write(f'err unknown command {command!r}\n'.encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            if store is not None:
+                store.close(slot)
+            writer.close()
+
+
+def raise_file_limit():
+    # One descriptor per session; the default soft limit is often 1024.
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def serve(host='127.0.0.1', port=DEFAULT_PORT, path=None, tick=0.0, ready=None):
+    server = GameServer(tick)
+    if path is not None:
+        listener = await asyncio.start_unix_server(server.handle, path, backlog=4096)
+    else:
+        listener = await asyncio.start_server(server.handle, host, port, backlog=4096)
+    ticker = asyncio.ensure_future(server.ticker())
+    if ready is not None:
+        ready()
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        ticker.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host many 2048 games over a local socket.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', metavar='PATH', help="listen on a Unix socket instead of TCP")
+    parser.add_argument('--tick-ms', type=float, default=0.0,
+                        help="wait this long after the first move of a tick for more to batch")
+    args = parser.parse_args()
+
+    raise_file_limit()
+    if args.unix and os.path.exists(args.unix):
+        os.unlink(args.unix)
+    where = args.unix or f'{args.host}:{args.port}'
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.tick_ms / 1000,
+                          lambda: print(f'serving 2048 on {where}', flush=True)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+from collections import namedtuple
+from lazy import lazy_import
+
+np = lazy_import('numpy')
+
+
+class Snapshot(namedtuple('Snapshot', 'version size state score')):
+    # One moment of a game: state is the board's state(), a bitboard int or
+    # cell bytes, so nothing in a snapshot can change after it is taken.
+    __slots__ = ()
+
+    def cells(self):
+        # Cell exponents, row by row.
+        if isinstance(self.state, int):
+            return [(self.state >> (4 * k)) & 15 for k in range(self.size * self.size)]
+        return self.state
+
+    def tile_rows(self):
+        n = self.size
+        cells = self.cells()
+        return [[1 << e if e else 0 for e in cells[i * n:i * n + n]] for i in range(n)]
+
+    def exponents(self):
+        return np.frombuffer(bytes(self.cells()), dtype=np.uint8).reshape(self.size, self.size)
+
+    def changed_cells(self, other):
+        # Cells that differ from an earlier snapshot (all of them for None).
+        n = self.size
+        if other is None:
+            return [(i, j) for i in range(n) for j in range(n)]
+        if isinstance(self.state, int) and isinstance(other.state, int):
+            diff = self.state ^ other.state
+            return [divmod(k, n) for k in range(n * n) if (diff >> (4 * k)) & 15]
+        return [divmod(k, n) for k, (a, b) in enumerate(zip(self.cells(), other.cells())) if a != b]
+
+
+class Publisher:
+    # Hands the game state from the code that plays moves to whatever draws
+    # it. The game calls publish() after every change; renderers and timer
+    # callbacks, on any thread, read latest with no lock. Rebinding one
+    # attribute is atomic, so a reader gets either the old snapshot or the
+    # new one, never a board caught halfway through a move, and a move
+    # never waits for a redraw.
+    def __init__(self, board):
+        self.latest = Snapshot(0, board.size, board.state(), board.score)
+
+    def publish(self, board):
+        self.latest = Snapshot(self.latest.version + 1, board.size, board.state(), board.score)
+        return self.latest
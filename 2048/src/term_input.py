@@ -0,0 +1,117 @@
+import heapq
+import os
+import sys
+import time
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import selectors
+    import termios
+    import tty
+
+ARROWS = {'A': 'w', 'B': 's', 'C': 'd', 'D': 'a'}
+WINDOWS_ARROWS = {'H': 'w', 'P': 's', 'M': 'd', 'K': 'a'}
+WINDOWS_POLL = 0.01
+
+
+def decode_keys(text):
+    # Turns raw terminal input into key names; arrow escape sequences map
+    # to w/a/s/d like the GUI versions.
+    keys = []
+    i = 0
+    while i < len(text):
+        if text.startswith('\x1b[', i) and i + 2 < len(text):
+            key = ARROWS.get(text[i + 2])
+            if key:
+                keys.append(key)
+            i += 3
+        else:
+            keys.append(text[i].lower())
+            i += 1
+    return keys
+
+
+class EventLoop:
+    # Single-threaded loop that sleeps in select() until a key arrives or
+    # the next timer is due.
+    def __init__(self, on_key, stream=None):
+        self.on_key = on_key
+        self.stream = stream or sys.stdin
+        self.timers = []
+        self.counter = 0
+        self.running = False
+        # perf_counter() of the latest input, for latency accounting.
+        self.key_time = time.perf_counter()
+
+    def call_later(self, delay, callback):
+        self.counter += 1
+        heapq.heappush(self.timers, (time.monotonic() + delay, self.counter, callback))
+
+    def call_every(self, interval, callback):
+        def tick():
+            callback()
+            self.call_later(interval, tick)
+        self.call_later(interval, tick)
+
+    def stop(self):
+        self.running = False
+
+    def run_timers(self):
+        now = time.monotonic()
+        while self.running and self.timers and self.timers[0][0] <= now:
+            heapq.heappop(self.timers)[2]()
+
+    def timeout(self):
+        if not self.timers:
+            return None
+        return max(self.timers[0][0] - time.monotonic(), 0)
+
+    def dispatch(self, text):
+        for key in decode_keys(text):
+            if not self.running:
+                break
+            self.on_key(key)
+
+    def run(self):
+        self.running = True
+        if os.name == 'nt':
+            self.run_windows()
+        else:
+            self.run_posix()
+
+    def run_posix(self):
+        fd = self.stream.fileno()
+        old = termios.tcgetattr(fd)
+        selector = selectors.DefaultSelector()
+        selector.register(fd, selectors.EVENT_READ)
+        try:
+            tty.setcbreak(fd)
+            while self.running:
+                if selector.select(self.timeout()):
+                    self.key_time = time.perf_counter()
+                    data = os.read(fd, 64)
+                    if not data:
+                        break
+                    self.dispatch(data.decode(errors='ignore'))
+                self.run_timers()
+        finally:
+            selector.close()
+            termios.tcsetattr(fd, termios.TCSADRAIN, old)
+
+    def run_windows(self):
+        while self.running:
+            text = ''
+            if msvcrt.kbhit():
+                self.key_time = time.perf_counter()
+            while msvcrt.kbhit():
+                ch = msvcrt.getwch()
+                if ch in ('\x00', '\xe0'):
+                    ch = WINDOWS_ARROWS.get(msvcrt.getwch(), '')
+                text += ch
+            if text:
+                self.dispatch(text)
+            else:
+                timeout = self.timeout()
+                time.sleep(WINDOWS_POLL if timeout is None else min(timeout, WINDOWS_POLL))
+            self.run_timers()
@@ -0,0 +1,83 @@
+import shutil
+import sys
+
+CELL_WIDTH = 8
+FOOTER = ('POWERED by JUICE', 'https://github.com/pure-deep-love/mini_games.git')
+
+
+def move_to(row, col):
+    return f'\x1b[{row};{col}H'
+
+
+class TerminalRenderer:
+    # Keeps the last frame drawn and writes only what changed, with ANSI
+    # cursor positioning, in a single write per frame. Rows and columns
+    # below are 1-based terminal coordinates. Only the event loop's thread
+    # draws, so nothing here is locked.
+    def __init__(self, size, out=None):
+        self.size = size
+        self.out = out or sys.stdout
+        self.width = max(CELL_WIDTH * size, 6 * size)
+        self.terminal_size = None
+        self.header = None
+        self.cells = None
+        self.texts = {}
+        self.overlay_rows = 0
+
+    def cell_text(self, value):
+        text = self.texts.get(value)
+        if text is None:
+            text = self.texts[value] = str(value).ljust(CELL_WIDTH - 1)
+        return text
+
+    def header_text(self, score, elapsed):
+        return f'YOUR SCORE: {score}\t\t\tTIME: {elapsed}'.expandtabs(CELL_WIDTH)
+
+    def full_frame(self, header, cells):
+        lines = [header, '-' * self.width]
+        for i, row in enumerate(cells):
+            lines.append(' '.join(row))
+            if i != self.size - 1:
+                lines.append('')
+        lines.append('-' * self.width)
+        lines.extend(FOOTER)
+        return '\x1b[H\x1b[2J' + '\n'.join(lines) + '\n'
+
+    def diff_frame(self, header, cells):
+        parts = []
+        if header != self.header:
+            parts.append(move_to(1, 1) + header + '\x1b[K')
+        for i, (old_row, row) in enumerate(zip(self.cells, cells)):
+            if old_row == row:
+                continue
+            for j, (old, text) in enumerate(zip(old_row, row)):
+                if old != text:
+                    parts.append(move_to(3 + 2 * i, 1 + CELL_WIDTH * j) + text)
+        if parts:
+            parts.append(move_to(2 * self.size + 5, 1))
+        return ''.join(parts)
+
+    def overlay(self, lines):
+        # Extra lines below the footer; an empty list clears them.
+        row = 2 * self.size + 6
+        parts = [move_to(row + i, 1) + line + '\x1b[K' for i, line in enumerate(lines)]
+        parts += [move_to(row + i, 1) + '\x1b[K' for i in range(len(lines), self.overlay_rows)]
+        parts.append(move_to(2 * self.size + 5, 1))
+        self.overlay_rows = len(lines)
+        self.out.write(''.join(parts))
+        self.out.flush()
+
+    def render(self, rows, score, elapsed):
+        header = self.header_text(score, elapsed)
+        cells = [[self.cell_text(v) for v in row] for row in rows]
+        terminal_size = shutil.get_terminal_size()
+        if self.cells is None or terminal_size != self.terminal_size:
+            frame = self.full_frame(header, cells)
+        else:
+            frame = self.diff_frame(header, cells)
+        self.terminal_size = terminal_size
+        self.header = header
+        self.cells = cells
+        if frame:
+            self.out.write(frame)
+            self.out.flush()
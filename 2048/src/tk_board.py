@@ -0,0 +1,99 @@
+import tkinter as tk
+
+VIEW_SIZE = 606
+# Boards up to this size get one canvas item per cell; larger ones scroll.
+MAX_FULL_SIZE = 20
+MIN_CELL, MAX_CELL = 12, 80
+
+
+class BoardView:
+    # Scrollable window onto a board too big for one canvas item per cell.
+    # A fixed pool of items covers the visible cells only; scrolling or a
+    # new board just relabels them, so cost depends on the view, not on N.
+    def __init__(self, master, size, cell_size=40):
+        self.size = size
+        self.cell_size = cell_size
+        self.row0 = self.col0 = 0
+        self.exponents = None
+        self.frame = tk.Frame(master)
+        self.canvas = tk.Canvas(self.frame, width=VIEW_SIZE, height=VIEW_SIZE)
+        self.yscroll = tk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.yview)
+        self.xscroll = tk.Scrollbar(self.frame, orient=tk.HORIZONTAL, command=self.xview)
+        self.canvas.grid(row=0, column=0)
+        self.yscroll.grid(row=0, column=1, sticky=tk.NS)
+        self.xscroll.grid(row=1, column=0, sticky=tk.EW)
+        self.canvas.bind("<MouseWheel>", self.wheel)
+        self.canvas.bind("<Button-4>", self.wheel)
+        self.canvas.bind("<Button-5>", self.wheel)
+        self.build()
+
+    def visible(self):
+        return min(VIEW_SIZE // self.cell_size, self.size)
+
+    def build(self):
+        self.canvas.delete("cell")
+        count = self.visible()
+        cell = self.cell_size
+        font = ("Helvetica Neue", max(6, min(20, cell // 3)))
+        self.items = []
+        for i in range(count):
+            row = []
+            for j in range(count):
+                x0, y0 = j * cell + 3, i * cell + 3
+                self.canvas.create_rectangle(x0, y0, x0 + cell, y0 + cell, fill="white", outline="black", tags="cell")
+                row.append(self.canvas.create_text(x0 + cell / 2, y0 + cell / 2, text="", font=font, tags="cell"))
+            self.items.append(row)
+        self.shown = [[None] * count for _ in range(count)]
+        self.scroll_to(self.row0, self.col0)
+
+    def scroll_to(self, row0, col0):
+        limit = self.size - self.visible()
+        self.row0 = min(max(row0, 0), limit)
+        self.col0 = min(max(col0, 0), limit)
+        self.yscroll.set(self.row0 / self.size, (self.row0 + self.visible()) / self.size)
+        self.xscroll.set(self.col0 / self.size, (self.col0 + self.visible()) / self.size)
+        self.draw()
+
+    def scroll_command(self, start, args):
+        # Scrollbar protocol: ('moveto', fraction) or ('scroll', n, 'units'|'pages').
+        if args[0] == 'moveto':
+            return int(float(args[1]) * self.size)
+        step = self.visible() if args[2] == 'pages' else 1
+        return start + int(args[1]) * step
+
+    def yview(self, *args):
+        self.scroll_to(self.scroll_command(self.row0, args), self.col0)
+
+    def xview(self, *args):
+        self.scroll_to(self.row0, self.scroll_command(self.col0, args))
+
+    def wheel(self, event):
+        up = event.num == 4 or event.delta > 0
+        if event.state & 0x4:
+            self.zoom(1.25 if up else 0.8)
+        elif event.state & 0x1:
+            self.scroll_to(self.row0, self.col0 + (-3 if up else 3))
+        else:
+            self.scroll_to(self.row0 + (-3 if up else 3), self.col0)
+
+    def zoom(self, factor):
+        cell_size = min(max(int(self.cell_size * factor), MIN_CELL), MAX_CELL)
+        if cell_size != self.cell_size:
+            self.cell_size = cell_size
+            self.build()
+
+    def set_board(self, exponents):
+        self.exponents = exponents
+        self.draw()
+
+    def draw(self):
+        if self.exponents is None:
+            return
+        count = len(self.items)
+        window = self.exponents[self.row0:self.row0 + count, self.col0:self.col0 + count].tolist()
+        for i, row in enumerate(window):
+            shown = self.shown[i]
+            for j, e in enumerate(row):
+                if shown[j] != e:
+                    shown[j] = e
+                    self.canvas.itemconfig(self.items[i][j], text=str(1 << e) if e else "")
@@ -0,0 +1,197 @@
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from engine import FOUR_PROB, KEYS, legal_moves_batch, move_batch, spawn_batch
+
+
+def _layout(num_envs, size):
+    # (name, dtype, shape) of every shared array, in buffer order.
+    return (('boards', np.uint8, (num_envs, size, size)),
+            ('actions', np.uint8, (num_envs,)),
+            ('rewards', np.int64, (num_envs,)),
+            ('dones', np.bool_, (num_envs,)),
+            ('legal', np.uint8, (num_envs,)),
+            ('scores', np.int64, (num_envs,)),
+            ('final_scores', np.int64, (num_envs,)))
+
+
+def _buffer_size(num_envs, size):
+    total = 0
+    for _, dtype, shape in _layout(num_envs, size):
+        total = -(-total // 8) * 8 + int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return total
+
+
+def _views(buf, num_envs, size):
+    arrays = {}
+    offset = 0
+    for name, dtype, shape in _layout(num_envs, size):
+        offset = -(-offset // 8) * 8
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset)
+        offset += arrays[name].nbytes
+    return arrays
+
+
+class _Slice:
+    # The environments lo:hi of the shared arrays, stepped together by one
+    # worker with its own generator for the new tiles.
+    def __init__(self, arrays, lo, hi, seed, four_prob):
+        self.arrays = {name: a[lo:hi] for name, a in arrays.items()}
+        self.four_prob = four_prob
+        self.seed(seed)
+
+    def seed(self, seed):
+        self.rng = np.random.default_rng(seed)
+
+    def spawn(self, index):
+        boards = self.arrays['boards']
+        cells = boards[index].reshape(len(index), -1)
+        draws = self.rng.random((len(index), 2))
+        spawn_batch(cells, draws[:, 0], draws[:, 1], self.four_prob)
+        boards[index] = cells.reshape(boards[index].shape)
+
+    def restart(self, index):
+        a = self.arrays
+        a['boards'][index] = 0
+        a['scores'][index] = 0
+        self.spawn(index)
+        self.spawn(index)
+        a['legal'][index] = legal_moves_batch(a['boards'][index])
+
+    def reset(self):
+        a = self.arrays
+        a['rewards'][:] = 0
+        a['dones'][:] = False
+        a['final_scores'][:] = 0
+        self.restart(np.arange(len(a['boards'])))
+
+    def run(self, command, seed=None):
+        if command == 'step':
+            self.step()
+            return
+        if seed is not None:
+            self.seed(seed)
+        self.reset()
+
+    def step(self):
+        # A move that changes nothing earns nothing and spawns nothing, as
+        # with Board.move. Finished games are recorded and restarted.
+        a = self.arrays
+        boards, actions = a['boards'], a['actions']
+        moved = np.zeros(len(boards), dtype=bool)
+        rewards = a['rewards']
+        rewards[:] = 0
+        for code, key in enumerate(KEYS):
+            sel = np.flatnonzero(actions == code)
+            if len(sel):
+                boards[sel], rewards[sel], moved[sel], _ = move_batch(boards[sel], key)
+        a['scores'] += rewards
+        if moved.any():
+            self.spawn(np.flatnonzero(moved))
+        a['legal'][:] = legal_moves_batch(boards)
+        dones = a['dones']
+        dones[:] = a['legal'] == 0
+        a['final_scores'][:] = np.where(dones, a['scores'], 0)
+        if dones.any():
+            self.restart(np.flatnonzero(dones))
+
+
+def _worker(name, num_envs, size, lo, hi, seed, four_prob, conn):
+    shm = SharedMemory(name)
+    part = _Slice(_views(shm.buf, num_envs, size), lo, hi, seed, four_prob)
+    try:
+        while True:
+            command, seed = conn.recv()
+            if command == 'close':
+                break
+            part.run(command, seed)
+            conn.send(None)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        # The views must go before the buffer can be closed.
+        del part
+        shm.close()
+
+
+class VecEnv:
+    # num_envs 2048 games stepped in lockstep, split across worker
+    # processes (or run in this process with workers=0):
+    #
+    #   env = VecEnv(64, size=4, workers=4, seed=0)
+    #   boards = env.reset()
+    #   boards, rewards, dones, info = env.step(actions)
+    #
+    # Boards are (num_envs, size, size) cell exponents and actions are
+    # indices into KEYS. Every array lives in shared memory, so a step
+    # moves no data between processes; the arrays returned are those
+    # shared views and are overwritten by the next step. A finished game
+    # starts over at once: its done flag is set, info['final_score'] has
+    # its score and the board returned is the new game's.
+    def __init__(self, num_envs, size=4, workers=None, seed=None, four_prob=FOUR_PROB):
+        # A worker with no games would have nothing to step.
+        workers = min(mp.cpu_count() if workers is None else workers, num_envs)
+        self.num_envs = num_envs
+        self.size = size
+        self.shm = SharedMemory(create=True, size=_buffer_size(num_envs, size))
+        self.arrays = _views(self.shm.buf, num_envs, size)
+        seeds = np.random.SeedSequence(seed).spawn(max(workers, 1))
+        bounds = np.linspace(0, num_envs, max(workers, 1) + 1).astype(int)
+        self.local = None
+        self.workers = []
+        if workers == 0:
+            self.local = _Slice(self.arrays, 0, num_envs, seeds[0], four_prob)
+            return
+        for w in range(workers):
+            parent, child = mp.Pipe()
+            proc = mp.Process(target=_worker, daemon=True,
+                              args=(self.shm.name, num_envs, size, bounds[w], bounds[w + 1], seeds[w], four_prob, child))
+            proc.start()
+            child.close()
+            self.workers.append((proc, parent))
+
+    def _run(self, command, seeds=None):
+        if self.local is not None:
+            self.local.run(command, seeds and seeds[0])
+            return
+        for i, (_, conn) in enumerate(self.workers):
+            conn.send((command, seeds and seeds[i]))
+        for _, conn in self.workers:
+            conn.recv()
+
+    def reset(self, seed=None):
+        # With a seed, every worker's generator starts over from it.
+        seeds = None if seed is None else np.random.SeedSequence(seed).spawn(max(len(self.workers), 1))
+        self._run('reset', seeds)
+        return self.arrays['boards']
+
+    def step(self, actions):
+        self.arrays['actions'][:] = actions
+        self._run('step')
+        a = self.arrays
+        return a['boards'], a['rewards'], a['dones'], {'legal': a['legal'], 'score': a['scores'],
+                                                       'final_score': a['final_scores']}
+
+    def close(self):
+        if self.shm is None:
+            return
+        for proc, conn in self.workers:
+            try:
+                conn.send(('close', None))
+            except OSError:
+                pass
+        for proc, conn in self.workers:
+            proc.join(timeout=5)
+            conn.close()
+        self.workers = []
+        self.local = None
+        self.arrays = None
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The game modules are flat files in src, imported by name.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
@@ -0,0 +1,42 @@
+import random
+import pytest
+import autosave
+from autosave import Session
+from engine import KEYS, Board
+
+
+def play(board, session, rng, moves):
+    for _ in range(moves):
+        keys = [key for key in KEYS if board.copy().move(key)[0]]
+        if not keys:
+            break
+        key = rng.choice(keys)
+        board.move(key)
+        board.spawn()
+        session.update(board, key)
+
+
+@pytest.mark.parametrize('size', [4, 9])
+def test_restored_session_continues(tmp_path, monkeypatch, size):
+    # A short checkpoint interval so restore() starts from a saved
+    # generator state with draws still to make after it.
+    monkeypatch.setattr(autosave, 'RNG_CHECKPOINT', 16)
+    path = tmp_path / 'session.2048s'
+    board = Board(size, seed=size)
+    board.spawn()
+    board.spawn()
+    session = Session.create(board, path)
+    play(board, session, random.Random(1), 45)
+    session.close()
+
+    restored = Session.open(path)
+    copy = restored.restore()
+    assert copy.state() == board.state()
+    assert copy.score == board.score
+    assert restored.moves == 45
+    # Both games go on with the same moves and must draw the same tiles.
+    play(board, Session.create(board.copy(), tmp_path / 'other.2048s'), random.Random(2), 100)
+    play(copy, restored, random.Random(2), 100)
+    assert copy.state() == board.state()
+    assert copy.score == board.score
+    restored.close()
@@ -0,0 +1,116 @@
+import random
+import numpy as np
+import pytest
+from engine import KEYS, MAX_INDEXED_SIZE, Board, _Tables
+
+
+# The slide of the original front ends, on lists of tile values.
+def reference_row(row):
+    tiles = [v for v in row if v]
+    out = []
+    gain = merges = 0
+    i = 0
+    while i < len(tiles):
+        if i + 1 < len(tiles) and tiles[i] == tiles[i + 1]:
+            out.append(2 * tiles[i])
+            gain += 2 * tiles[i]
+            merges += 1
+            i += 2
+        else:
+            out.append(tiles[i])
+            i += 1
+    return out + [0] * (len(row) - len(out)), gain, merges
+
+
+def reference_move(grid, key):
+    n = len(grid)
+    g = [row[:] for row in grid]
+    gain = merges = 0
+    for i in range(n):
+        if key in 'ad':
+            line = g[i] if key == 'a' else g[i][::-1]
+        else:
+            line = [g[r][i] for r in range(n)]
+            line = line if key == 'w' else line[::-1]
+        out, row_gain, row_merges = reference_row(line)
+        if key in 'ds':
+            out = out[::-1]
+        if key in 'ad':
+            g[i] = out
+        else:
+            for r in range(n):
+                g[r][i] = out[r]
+        gain += row_gain
+        merges += row_merges
+    return g, g != grid, gain, merges
+
+
+def random_exponents(rng, n):
+    e = np.array([[rng.randrange(1, 6) for _ in range(n)] for _ in range(n)], dtype=np.uint8)
+    for i in range(n):
+        for j in range(n):
+            if rng.random() < 0.3:
+                e[i, j] = 0
+    return e
+
+
+def check_free(board):
+    e = board.exponents()
+    assert sorted(board.empty_cells()) == np.flatnonzero(e.reshape(-1) == 0).tolist()
+    if board._free is not None:
+        assert all(board._slot[k] == i for i, k in enumerate(board._free))
+        assert sum(s >= 0 for s in board._slot) == len(board._free)
+
+
+@pytest.mark.parametrize('n', range(3, MAX_INDEXED_SIZE + 1))
+def test_move_matches_reference(n):
+    rng = random.Random(n)
+    for _ in range(40):
+        e = random_exponents(rng, n)
+        grid = [[1 << int(x) if x else 0 for x in row] for row in e]
+        legal = 0
+        for bit, key in enumerate(KEYS):
+            expected, moved, gain, merges = reference_move(grid, key)
+            legal |= moved << bit
+            board = Board.from_exponents(e, score=7)
+            assert board.move(key) == ((True, gain, merges) if moved else (False, 0, 0))
+            assert board.grid().tolist() == expected
+            assert board.score == 7 + (gain if moved else 0)
+            check_free(board)
+        assert Board.from_exponents(e).legal_moves() == legal
+        assert Board.from_exponents(e).check() == (legal != 0)
+
+
+@pytest.mark.parametrize('n', range(3, MAX_INDEXED_SIZE + 1))
+def test_free_cells_during_play(n):
+    rng = random.Random(n)
+    board = Board(n, seed=n)
+    for _ in range(300):
+        if not board.check():
+            board = Board(n, seed=rng.randrange(1000))
+        board.spawn()
+        board.move(rng.choice(KEYS))
+        check_free(board)
+
+
+def test_bitboard_overflow():
+    # Two 32768 tiles merge into a tile a 4-bit nibble cannot hold.
+    board = Board.from_exponents([[15, 15, 0, 0]] + [[0] * 4] * 3)
+    assert board.move('a') == (True, 65536, 1)
+    assert board.grid()[0].tolist() == [65536, 0, 0, 0]
+    assert board.score == 65536
+    assert board._bits is None
+    assert board.move('d') == (True, 0, 0)
+    assert board.grid()[0].tolist() == [0, 0, 0, 65536]
+    check_free(board)
+
+
+def test_missing_rows_raise_once(monkeypatch):
+    # Rows that never make it into the tables are an error, not a retry loop.
+    board = Board.from_exponents([[1, 2, 3], [4, 5, 6], [7, 8, 9]])
+    # Empty tables of its own, not the ones shared by every 3x3 board.
+    board._tables = _Tables(3)
+    monkeypatch.setattr(board._tables, 'add_row', lambda row: None)
+    for call in (lambda: board.move('a'), board.empty_cells, board.legal_moves, board.row_keys):
+        with pytest.raises(TypeError):
+            call()
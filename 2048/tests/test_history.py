@@ -0,0 +1,90 @@
+import random
+import pytest
+from engine import KEYS, Board
+from history import History, apply_delta, state_delta
+
+
+def walk(board, history, rng, moves):
+    # Plays random legal moves and returns the (state, score) after each.
+    seen = []
+    for _ in range(moves):
+        keys = [key for key in KEYS if board.copy().move(key)[0]]
+        if not keys:
+            break
+        before, score = board.state(), board.score
+        board.move(rng.choice(keys))
+        board.spawn()
+        history.push(before, score, board)
+        seen.append((board.state(), board.score))
+    return seen
+
+
+@pytest.mark.parametrize('size', [4, 9, 24])
+def test_undo_to_start_and_redo_to_end(size):
+    board = Board(size, seed=size)
+    board.spawn()
+    board.spawn()
+    history = History()
+    states = [(board.state(), board.score)] + walk(board, history, random.Random(size), 150)
+    assert len(history) == len(states) - 1
+    for expected in reversed(states[:-1]):
+        assert history.undo(board)
+        assert (board.state(), board.score) == expected
+    assert not history.undo(board)
+    for expected in states[1:]:
+        assert history.redo(board)
+        assert (board.state(), board.score) == expected
+    assert not history.redo(board)
+
+
+def test_new_move_drops_redos():
+    board = Board(5, seed=1)
+    board.spawn()
+    board.spawn()
+    history = History()
+    walk(board, history, random.Random(1), 20)
+    history.undo(board)
+    history.undo(board)
+    walk(board, history, random.Random(2), 1)
+    assert not history.redo(board)
+    assert len(history) == 19
+
+
+def test_limit_drops_oldest():
+    board = Board(9, seed=2)
+    board.spawn()
+    board.spawn()
+    history = History(limit=2000)
+    states = walk(board, history, random.Random(2), 100)
+    assert 0 < len(history) < len(states)
+    assert history.nbytes <= history.limit
+    while history.undo(board):
+        pass
+    # The oldest moves can no longer be undone.
+    assert (board.state(), board.score) == states[-len(history.redos) - 1]
+
+
+def test_bitboard_overflow_round_trip():
+    # Two 32768 tiles merge into a tile only the cell storage can hold.
+    board = Board.from_exponents([[15, 15, 0, 0], [1, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]])
+    history = History()
+    before, score = board.state(), board.score
+    board.move('a')
+    history.push(before, score, board)
+    after = board.state()
+    assert isinstance(before, int) and isinstance(after, bytes)
+    assert history.undo(board)
+    assert (board.state(), board.score) == (before, 0)
+    assert history.redo(board)
+    assert (board.state(), board.score) == (after, 65536)
+    assert board.grid()[0].tolist() == [65536, 0, 0, 0]
+
+
+def test_cell_deltas_are_compressed():
+    old = bytes(400)
+    new = bytearray(old)
+    new[17] = 3
+    delta = state_delta(old, bytes(new))
+    assert len(delta) < 40
+    assert apply_delta(old, delta) == bytes(new)
+    assert apply_delta(bytes(new), delta) == old
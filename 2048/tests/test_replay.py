@@ -0,0 +1,64 @@
+import random
+import pytest
+from engine import KEYS, Board
+from replay import HEADER, Recorder, Replay, parse_replays, read_replays, verify, verify_batch, verify_files, write_replays
+
+
+def play(size, seed, moves):
+    rng = random.Random(seed)
+    board = Board(size, seed)
+    board.spawn()
+    board.spawn()
+    recorder = Recorder(board)
+    for _ in range(moves):
+        keys = [key for key in KEYS if board.copy().move(key)[0]]
+        if not keys:
+            break
+        key = rng.choice(keys)
+        board.move(key)
+        recorder.add(key)
+        board.spawn()
+    return recorder.replay()
+
+
+@pytest.fixture
+def replays():
+    return [play(size, seed, 40 + 25 * seed) for size in (3, 4, 5) for seed in range(4)]
+
+
+def test_round_trip(tmp_path, replays):
+    path = tmp_path / 'replays.2048r'
+    write_replays(path, replays[:6])
+    write_replays(path, replays[6:], append=True)
+    loaded = read_replays(path)
+    assert [r.keys() for r in loaded] == [r.keys() for r in replays]
+    assert [(r.size, r.seed, r.score, r.digest) for r in loaded] == \
+        [(r.size, r.seed, r.score, r.digest) for r in replays]
+    assert all(verify(r) for r in loaded)
+    assert verify_batch(loaded) == [True] * len(loaded)
+
+
+def test_tampered_record(replays):
+    data = bytearray(b''.join(r.to_bytes() for r in replays))
+    # The last byte of the first record holds its last moves.
+    end = len(replays[0].to_bytes())
+    data[end - 1] ^= 0xFF
+    loaded = parse_replays(bytes(data))
+    results = verify_batch(loaded)
+    assert results[0] is False
+    assert results[1:] == [True] * (len(replays) - 1)
+    assert verify(loaded[0]) is False
+
+
+def test_bad_records(tmp_path, replays):
+    good = replays[0].to_bytes()
+    bad_size = [Replay(size, 1, [0, 1], 0, bytes(8)).to_bytes() for size in (0, 2, 65535)]
+    data = good + b''.join(bad_size) + good
+    assert verify_batch(parse_replays(data)) == [True, False, False, False, True]
+    # A header cut short, and moves running past the end of the data.
+    for tail in (good[:HEADER.size - 3], good[:-1]):
+        assert verify_batch(parse_replays(good + tail)) == [True, False]
+    path = tmp_path / 'replays.2048r'
+    path.write_bytes(good + b'not a replay' + good)
+    results, _ = verify_files([path], workers=1)
+    assert results == [True, False]